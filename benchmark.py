@@ -0,0 +1,453 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+
+from lazors import (Board, CELL_CODES, CELL_TYPES, DIRECTIONS, DIRECTION_INDEX, TRANSITIONS, SOLVERS,
+                    ORDERED_SOLVERS, SLOT_ORDERS, count_placements, find_block_positions, generate_block_grids,
+                    iter_placements, parse_bff, reflect_or_refract, trace, trace_all, transition_key)
+
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels')
+
+# For each metric, whether a bigger number is better
+METRICS = {
+    'parse_seconds': False,
+    'enumerate_per_second': True,
+    'trace_steps_per_second': True,
+    'solve_seconds': False,
+}
+
+# Budget for `import lazors` with warm bytecode, in microseconds
+IMPORT_BUDGET_US = 10000
+
+# Boards with the same shape and block counts as the larger reference levels
+BOARDS = {
+    'mad_7': (5, 5, {'A': 4, 'B': 2, 'C': 2}),
+    'yarn_5': (5, 6, {'A': 5, 'B': 3, 'C': 2}),
+}
+
+def open_grid(cols, rows):
+    """
+    Builds an expanded grid where every block position is a movable slot.
+    """
+    grid = [['x' for _ in range(cols * 2 + 1)] for _ in range(rows * 2 + 1)]
+    for i in range(rows):
+        for j in range(cols):
+            grid[2*i+1][2*j+1] = 'o'
+    return grid
+
+def legacy_first_candidate(slots, blocks):
+    """
+    Reproduces the old enumeration: dedupe n! permutations before the first yield.
+    """
+    all_blocks = ['A'] * blocks['A'] + ['B'] * blocks['B'] + ['C'] * blocks['C']
+    perms = set(itertools.permutations(all_blocks))
+    combo = next(itertools.combinations(slots, len(all_blocks)))
+    return tuple(zip(combo, next(iter(perms)))), math.factorial(len(all_blocks))
+
+def bench_enumerator(name, cols, rows, blocks, sample=100000):
+    """
+    Reports candidate counts, time-to-first-candidate and throughput.
+    """
+    slots = find_block_positions(open_grid(cols, rows))
+
+    start = time.perf_counter()
+    placements = iter_placements(slots, blocks)
+    next(placements)
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    count = sum(1 for _ in itertools.islice(placements, sample))
+    rate = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    _, legacy_perms = legacy_first_candidate(slots, blocks)
+    legacy_first = time.perf_counter() - start
+
+    print(f"{name}: {len(slots)} slots, blocks {blocks}")
+    print(f"  distinct candidates:     {count_placements(len(slots), blocks):,}")
+    print(f"  first candidate:         {first * 1e6:.1f} us (legacy {legacy_first * 1e3:.1f} ms, "
+          f"{legacy_perms:,} permutations built)")
+    print(f"  enumeration throughput:  {rate:,.0f} placements/s")
+
+def random_grid(cols, rows, rng):
+    """
+    Builds an expanded grid with a random cell type in every block position.
+    """
+    grid = open_grid(cols, rows)
+    for i in range(rows):
+        for j in range(cols):
+            grid[2*i+1][2*j+1] = rng.choice(CELL_TYPES)
+    return grid
+
+def bench_transitions(samples=200000, seed=0):
+    """
+    Compares beam steps per second for reflect_or_refract against the
+    precomputed TRANSITIONS table, on random boards and random beam states.
+    """
+    rng = random.Random(seed)
+    board = Board.from_grid(random_grid(5, 5, rng))
+    diagonals = [d for d, (dx, dy) in enumerate(DIRECTIONS) if dx and dy]
+    steps = []
+    for _ in range(samples):
+        p = rng.randrange(board.width * board.height)
+        d = rng.choice(diagonals)
+        code = board.cells[board.look[p * 9 + d]]
+        steps.append(((p % board.width, p // board.width), d, code))
+
+    legacy = [((x, y), DIRECTIONS[d], CELL_TYPES[code]) for (x, y), d, code in steps]
+    start = time.perf_counter()
+    for pos, direction, block in legacy:
+        reflect_or_refract(pos, direction, block)
+    legacy_rate = samples / (time.perf_counter() - start)
+
+    keys = [transition_key(code, x % 2, d) for (x, _), d, code in steps]
+    start = time.perf_counter()
+    for key in keys:
+        TRANSITIONS[key]
+    table_rate = samples / (time.perf_counter() - start)
+
+    print(f"transitions ({samples:,} random steps)")
+    print(f"  reflect_or_refract: {legacy_rate:,.0f} steps/s")
+    print(f"  TRANSITIONS table:  {table_rate:,.0f} steps/s ({table_rate / legacy_rate:.1f}x)")
+
+class RayTable:
+    """
+    Ray-jump tables for a Board, so a beam crosses empty stretches in one
+    lookup instead of one half-cell step at a time. An experiment kept for
+    bench_rays: building the tables costs far more than the steps they
+    save on one board, and keeping them current across a search costs more
+    than tracing afresh, so the solvers trace with lazors.trace_targets.
+
+    For every (position, direction) state, stop holds the state where a beam
+    going straight on from there next meets a block or leaves the board, and
+    points and looks hold bitmasks (bit = position or cell index) of what it
+    passes and looks at on the way. set() changes a cell and refreshes only
+    the states whose straight run ends at or passes over it.
+    """
+    def __init__(self, board):
+        self.board = board
+        w, look, step = board.width, board.look, board.step
+        n = len(look)
+        # The next state straight on, the one before it, and the states looking at each cell
+        self._next = [-1] * n
+        self._prev = [-1] * n
+        self._lookers = [[] for _ in board.cells]
+        for state in range(n):
+            p, d = divmod(state, 9)
+            if step[state] >= 0 and step[state] != p:
+                self._next[state] = step[state] * 9 + d
+                self._prev[step[state] * 9 + d] = state
+            self._lookers[look[state]].append(state)
+        self.stop = [0] * n
+        self.points = [0] * n
+        self.looks = [0] * n
+        for state in range(n):
+            if self._prev[state] < 0:
+                run = [state]
+                while self._next[run[-1]] >= 0:
+                    run.append(self._next[run[-1]])
+                for s in reversed(run):
+                    self._refresh(s)
+
+    def _ends(self, state):
+        """
+        Checks whether a beam in this state stops going straight on.
+        """
+        d = state % 9
+        cells, w = self.board.cells, self.board.width
+        return (self._next[state] < 0 or
+                TRANSITIONS[cells[self.board.look[state]] * 18 + (state // 9 % w & 1) * 9 + d] != (d,))
+
+    def _refresh(self, state):
+        p_bit, q_bit = 1 << state // 9, 1 << self.board.look[state]
+        if self._ends(state):
+            self.stop[state], self.points[state], self.looks[state] = state, p_bit, q_bit
+        else:
+            n = self._next[state]
+            self.stop[state] = self.stop[n]
+            self.points[state] = p_bit | self.points[n]
+            self.looks[state] = q_bit | self.looks[n]
+
+    def set(self, i, j, block):
+        """
+        Puts block (a cell type) at row i, column j and refreshes the tables.
+        """
+        q = i * self.board.width + j
+        code = CELL_CODES[block]
+        if self.board.cells[q] == code:
+            return
+        self.board.cells[q] = code
+        prev = self._prev
+        for state in self._lookers[q]:
+            self._refresh(state)
+            state = prev[state]
+            while state >= 0 and not self._ends(state):
+                self._refresh(state)
+                state = prev[state]
+
+    def mask(self, points):
+        """
+        Returns the bitmask of a list of (x, y) points, as Board.mask.
+        """
+        return self.board.mask(points)
+
+    def trace(self, lazors, targets=None):
+        """
+        Traces every lazor, jumping from one block or board exit to the next.
+        Returns (points, looks) bitmasks of every position hit and every cell
+        looked at. With a targets bitmask (see mask) it returns as soon as
+        all of them are hit.
+        """
+        w, cells, look, step = self.board.width, self.board.cells, self.board.look, self.board.step
+        stop, points, looks = self.stop, self.points, self.looks
+        queue = []
+        for start, direction in lazors:
+            if direction not in DIRECTION_INDEX:
+                raise ValueError(f"Lazor direction must be a unit step, got {direction}")
+            p = self.board.position(*start)
+            if p >= 0:
+                queue.append(p * 9 + DIRECTION_INDEX[direction])
+        visited = set()
+        hit, seen = 0, 0
+        while queue:
+            state = queue.pop()
+            end = stop[state]
+            hit |= points[state]
+            seen |= looks[state]
+            if targets is not None and hit & targets == targets:
+                break
+            if end in visited:
+                continue
+            visited.add(end)
+            p, d = divmod(end, 9)
+            for e in TRANSITIONS[cells[look[end]] * 18 + (p % w & 1) * 9 + d]:
+                nxt = step[p * 9 + e]
+                if nxt >= 0:
+                    queue.append(nxt * 9 + e)
+        return hit, seen
+
+def bench_rays(boards=200, seed=0):
+    """
+    Compares trace_all with RayTable.trace on random boards, and reports
+    what it costs to keep the tables current as single cells change.
+    """
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(boards):
+        board = Board.from_grid(random_grid(5, 5, rng))
+        x = rng.randrange(board.width)
+        y = rng.randrange(1 - x % 2, board.height, 2)
+        cases.append((board, RayTable(board), [((x, y), rng.choice([(1, 1), (1, -1), (-1, 1), (-1, -1)]))]))
+
+    step_seconds = best_time(lambda: [trace_all(board, lazors) for board, _, lazors in cases])
+    ray_seconds = best_time(lambda: [rays.trace(lazors) for _, rays, lazors in cases])
+    slots = [(2*i+1, 2*j+1) for i in range(5) for j in range(5)]
+    changes = []
+    for board, rays, _ in cases:
+        slot = rng.choice(slots)
+        block = rng.choice([b for b in CELL_TYPES if b != board.get(*slot)])
+        changes.append((rays, slot, block, board.get(*slot)))
+
+    def change_and_restore():
+        for rays, slot, block, old in changes:
+            rays.set(*slot, block)
+            rays.set(*slot, old)
+    set_seconds = best_time(change_and_restore) / 2
+
+    print(f"ray tables ({boards} random 5x5 boards)")
+    print(f"  trace_all:      {step_seconds / boards * 1e6:.1f} us/board")
+    print(f"  RayTable.trace: {ray_seconds / boards * 1e6:.1f} us/board "
+          f"({step_seconds / ray_seconds:.1f}x)")
+    print(f"  RayTable.set:   {set_seconds / boards * 1e6:.1f} us/cell change")
+
+def best_time(fn, repeat=5, number=1):
+    """
+    Returns the fastest of repeat runs of fn, each called number times,
+    in seconds per call.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def bench_level(file_path, method='backtrack', sample=20000):
+    """
+    Times the hot paths on one level and returns them as a dict of METRICS.
+    """
+    grid, blocks, lazors, targets = parse_bff(file_path)
+    parse_seconds = best_time(lambda: parse_bff(file_path), number=50)
+
+    def enumerate_sample():
+        for _ in itertools.islice(generate_block_grids(grid, blocks, inplace=True), sample):
+            pass
+    enumerate_seconds = best_time(enumerate_sample, repeat=3)
+    enumerated = sum(1 for _ in itertools.islice(generate_block_grids(grid, blocks, inplace=True), sample))
+
+    # Trace the solved board, where beams are at their longest
+    solve_seconds = best_time(lambda: SOLVERS[method](*parse_bff(file_path)), repeat=3)
+    solved, _ = SOLVERS[method](grid, blocks, lazors, targets)
+    board = Board.from_grid(solved if solved is not None else grid)
+    steps = sum(len(trace(board, pos, direction)) for pos, direction in lazors)
+    trace_seconds = best_time(lambda: [trace(board, pos, direction) for pos, direction in lazors],
+                              number=200)
+
+    return {
+        'parse_seconds': parse_seconds,
+        'enumerate_per_second': enumerated / enumerate_seconds,
+        'trace_steps_per_second': steps / trace_seconds,
+        'solve_seconds': solve_seconds,
+    }
+
+def bench_levels(levels_dir=LEVELS_DIR, method='backtrack'):
+    """
+    Runs bench_level over every .bff file in a directory, printing a table.
+    Returns {level name: metrics}.
+    """
+    results = {}
+    print(f"{'level':<16}{'parse':>12}{'enumerate':>16}{'trace':>16}{'solve':>12}")
+    for name in sorted(os.listdir(levels_dir)):
+        if not name.endswith('.bff'):
+            continue
+        level = name[:-4]
+        r = results[level] = bench_level(os.path.join(levels_dir, name), method)
+        print(f"{level:<16}{r['parse_seconds'] * 1e6:>10.1f}us{r['enumerate_per_second']:>12,.0f}/s "
+              f"{r['trace_steps_per_second']:>12,.0f}/s{r['solve_seconds'] * 1e3:>10.2f}ms")
+    return results
+
+def bench_orders(levels_dir=LEVELS_DIR, methods=('brute', 'backtrack')):
+    """
+    Measures time to first solution for every slot-ordering heuristic in
+    SLOT_ORDERS, per level and method, printing a table.
+    Returns {method: {order: {level name: seconds}}}.
+    """
+    levels = sorted(name[:-4] for name in os.listdir(levels_dir) if name.endswith('.bff'))
+    results = {}
+    for method in methods:
+        print(f"{method:<14}" + ''.join(f"{level:>14}" for level in levels))
+        for order in sorted(SLOT_ORDERS):
+            row = results.setdefault(method, {})[order] = {}
+            for level in levels:
+                args = parse_bff(os.path.join(levels_dir, level + '.bff'))
+                row[level] = best_time(lambda: SOLVERS[method](*args, order=order), repeat=3)
+            print(f"  {order:<12}" + ''.join(f"{row[level] * 1e3:>12.2f}ms" for level in levels))
+    return results
+
+def import_times(module='lazors', runs=5):
+    """
+    Imports module in fresh interpreters under python -X importtime and
+    returns the fastest run as {imported package: cumulative microseconds}
+    for the module and everything it imports directly. A first, untimed run
+    makes sure the bytecode is cached, as it would be for users.
+    """
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    command = [sys.executable, '-X', 'importtime', '-c', f'import {module}']
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run(command, cwd=cwd, env=env, capture_output=True, check=True)
+    best = None
+    for _ in range(runs):
+        stderr = subprocess.run(command, cwd=cwd, env=env, capture_output=True, text=True,
+                                check=True).stderr
+        times = {}
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or '|' not in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            # Each import is listed after everything it imported, indented two
+            # spaces per level, so the module's direct imports come just before it
+            name = name[1:]
+            if name == module:
+                times[module] = int(cumulative)
+                break
+            if not name.startswith(' '):
+                times = {}
+            elif not name.startswith('   '):
+                times[name.strip()] = int(cumulative)
+        if best is None or times[module] < best[module]:
+            best = times
+    return best
+
+def bench_imports(budget=IMPORT_BUDGET_US):
+    """
+    Prints what `import lazors` costs and which of its imports cost the
+    most. Returns a list with a regression message if it is over budget.
+    """
+    times = import_times()
+    total = times.pop('lazors')
+    print(f"import lazors: {total / 1e3:.2f} ms (budget {budget / 1e3:.2f} ms)")
+    for name, us in sorted(times.items(), key=lambda item: -item[1])[:5]:
+        print(f"  {name:<20}{us / 1e3:>8.2f} ms")
+    if total > budget:
+        return [f"import lazors: {total / 1e3:.2f} ms, over the {budget / 1e3:.2f} ms budget"]
+    return []
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Compares results against a saved baseline and returns a list of
+    regressions: metrics that got worse by more than tolerance.
+    """
+    regressions = []
+    for level, metrics in results.items():
+        for metric, bigger_is_better in METRICS.items():
+            old = baseline.get(level, {}).get(metric)
+            if old is None:
+                continue
+            new = metrics[metric]
+            ratio = old / new if bigger_is_better else new / old
+            if ratio > 1 + tolerance:
+                regressions.append(f"{level} {metric}: {old:.6g} -> {new:.6g} ({ratio:.2f}x worse)")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Lazor solver on the reference levels.')
+    parser.add_argument('--levels', default=LEVELS_DIR, help='directory of .bff levels')
+    parser.add_argument('--method', default='backtrack', choices=sorted(SOLVERS))
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare against results saved with --output')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown before a metric counts as a regression')
+    parser.add_argument('--micro', action='store_true',
+                        help='also run the enumerator and transition microbenchmarks')
+    parser.add_argument('--orders', action='store_true',
+                        help='also time each slot-ordering heuristic to the first solution')
+    parser.add_argument('--imports', action='store_true',
+                        help='also check the time to import lazors against --import-budget')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET_US / 1e3,
+                        help='import time budget in milliseconds (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    regressions = []
+    if args.imports:
+        regressions += bench_imports(args.import_budget * 1e3)
+
+    if args.micro:
+        for name, (cols, rows, blocks) in BOARDS.items():
+            bench_enumerator(name, cols, rows, blocks)
+        bench_transitions()
+        bench_rays()
+    if args.orders:
+        bench_orders(args.levels, sorted(ORDERED_SOLVERS))
+
+    results = bench_levels(args.levels, args.method)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'method': args.method, 'levels': results}, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['levels']
+        regressions += compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,2241 @@
+import itertools
+import math
+import functools
+import collections
+import os
+import sys
+import time
+
+# PIL, and the stdlib modules that only the process pool, the caches and
+# the command line need, are imported by the functions that use them, so
+# that importing lazors for parse_bff or trace stays cheap (see
+# benchmark.py --imports)
+
+# ========================
+# STEP 1: Parse BFF Format
+# ========================
+class BffError(ValueError):
+    """
+    A malformed .bff file. The message starts with file:line, and the file
+    name and 1-based line number are kept as path and line.
+    """
+    def __init__(self, path, line, message):
+        super().__init__(f"{path}:{line}: {message}")
+        self.path = path
+        self.line = line
+        self.message = message
+
+    def __reduce__(self):
+        # Rebuild from the three values, so errors survive a process pool
+        return BffError, (self.path, self.line, self.message)
+
+def _bff_ints(tokens, count, path, line_no, what):
+    """
+    Converts the tokens after a .bff keyword to count ints.
+    """
+    if len(tokens) != count + 1:
+        raise BffError(path, line_no, f"{what} takes {count} number(s), got {len(tokens) - 1}")
+    try:
+        return [int(t) for t in tokens[1:]]
+    except ValueError:
+        raise BffError(path, line_no, f"{what} expects integers, got {' '.join(tokens[1:])!r}") from None
+
+def parse_bff(filepath):
+    """
+    Parses the input .bff file containing the puzzle configuration.
+
+    The file is read line by line in a single pass. Leading and trailing
+    whitespace, blank lines and '#' comment lines are ignored; anything else
+    that is not a grid row, block count, lazor or target raises a BffError
+    giving the file and line.
+
+    Returns:
+        - grid_full: the grid with placeholders for lasers and blocks
+        - blocks: dictionary containing the count of each block type (A, B, C)
+        - lazors: list of lazor starting positions and directions
+        - points: list of target points the lazor must pass through
+    """
+    grid_raw = []
+    grid_line = None  # Line of GRID START while inside the grid
+    grid_done = False
+    blocks = {'A': 0, 'B': 0, 'C': 0}
+    counted = set()
+    lazors = []
+    points = []
+    line_no = 0
+
+    with open(filepath, 'r') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+            if grid_line is not None:
+                if line == 'GRID STOP':
+                    if not grid_raw:
+                        raise BffError(filepath, line_no, "empty grid")
+                    grid_line, grid_done = None, True
+                    continue
+                row = list(''.join(line.split()))  # Cells may or may not be spaced
+                for c in row:
+                    if c not in ('o', 'x', 'A', 'B', 'C'):
+                        raise BffError(filepath, line_no, f"unknown grid cell {c!r}")
+                if grid_raw and len(row) != len(grid_raw[0]):
+                    raise BffError(filepath, line_no,
+                                   f"grid row has {len(row)} cells, expected {len(grid_raw[0])}")
+                grid_raw.append(row)
+                continue
+
+            if line == 'GRID START':
+                if grid_done:
+                    raise BffError(filepath, line_no, "second GRID START")
+                grid_line = line_no
+                continue
+            tokens = line.split()
+            key = tokens[0]
+            if key in blocks:
+                if key in counted:
+                    raise BffError(filepath, line_no, f"block count for {key} given twice")
+                counted.add(key)
+                n, = _bff_ints(tokens, 1, filepath, line_no, f"block count {key}")
+                if n < 0:
+                    raise BffError(filepath, line_no, f"negative block count for {key}")
+                blocks[key] = n
+            elif key == 'L':
+                x, y, dx, dy = _bff_ints(tokens, 4, filepath, line_no, "lazor L")
+                lazors.append(((x, y), (dx, dy)))
+            elif key == 'P':
+                x, y = _bff_ints(tokens, 2, filepath, line_no, "target P")
+                points.append((x, y))
+            else:
+                raise BffError(filepath, line_no, f"unexpected line {line!r}")
+
+    if grid_line is not None:
+        raise BffError(filepath, grid_line, "GRID START without GRID STOP")
+    if not grid_done:
+        raise BffError(filepath, line_no, "no GRID START ... GRID STOP section")
+
+    # Expand grid to accommodate lazor movement in half-unit steps
+    grid_full = [['x' for _ in range(len(grid_raw[0]) * 2 + 1)] for _ in range(len(grid_raw) * 2 + 1)]
+    for i, row in enumerate(grid_raw):
+        for j, val in enumerate(row):
+            grid_full[2*i+1][2*j+1] = val  # Fill in only valid grid spaces
+
+    return grid_full, blocks, lazors, points
+
+# ==================================
+# STEP 2: Flat Board Representation
+# ==================================
+# Cell codes: a cell's code is its index in CELL_TYPES
+CELL_TYPES = 'oxABC'
+CELL_CODES = {c: i for i, c in enumerate(CELL_TYPES)}
+OPEN, FIXED, REFLECT, OPAQUE, REFRACT = range(len(CELL_TYPES))
+
+# Every unit step a lazor can take; a direction's index is its position here
+DIRECTIONS = tuple((dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1))
+DIRECTION_INDEX = {d: i for i, d in enumerate(DIRECTIONS)}
+
+@functools.lru_cache(maxsize=None)
+def board_tables(width, height):
+    """
+    Precomputes the neighbor lookups shared by every board of a given size.
+
+    Both tables are indexed by position * len(DIRECTIONS) + direction index:
+        - look: index of the cell a lazor looks at from that position, or
+          width * height (an always-'x' sentinel cell) when it is off the board
+        - step: index of the next position in that direction, or -1
+    """
+    look, step = [], []
+    for y in range(height):
+        for x in range(width):
+            for dx, dy in DIRECTIONS:
+                cx, cy = (x + dx, y) if x % 2 == 0 else (x, y + dy)
+                inside = 0 <= cx < width and 0 <= cy < height
+                look.append(cy * width + cx if inside else width * height)
+                nx, ny = x + dx, y + dy
+                step.append(ny * width + nx if 0 <= nx < width and 0 <= ny < height else -1)
+    return look, step
+
+class Board:
+    """
+    Compact, array-backed version of the expanded grid.
+
+    Cells are stored row-major as integer codes in a bytearray with a stride
+    of width, followed by one sentinel 'x' cell that stands in for anything
+    off the board. Positions use the same indexing as cells.
+    """
+    def __init__(self, width, height, cells=None):
+        self.width = width
+        self.height = height
+        if cells is None:
+            cells = bytearray(width * height) + bytes([FIXED])
+        self.cells = cells
+        self.look, self.step = board_tables(width, height)
+
+    @classmethod
+    def from_grid(cls, grid):
+        """
+        Builds a board from a list-of-lists grid as returned by parse_bff.
+        """
+        try:
+            codes = [CELL_CODES[c] for row in grid for c in row]
+        except KeyError as err:
+            raise ValueError(f"Unknown cell type {err.args[0]!r}") from None
+        return cls(len(grid[0]), len(grid), bytearray(codes + [FIXED]))
+
+    def to_grid(self):
+        """
+        Converts the board back into a list-of-lists grid.
+        """
+        w = self.width
+        return [[CELL_TYPES[c] for c in self.cells[i*w:(i+1)*w]] for i in range(self.height)]
+
+    def copy(self):
+        return Board(self.width, self.height, bytearray(self.cells))
+
+    def get(self, i, j):
+        """
+        Returns the cell type at row i, column j ('x' when off the board).
+        """
+        if 0 <= i < self.height and 0 <= j < self.width:
+            return CELL_TYPES[self.cells[i * self.width + j]]
+        return 'x'
+
+    def set(self, i, j, block):
+        self.cells[i * self.width + j] = CELL_CODES[block]
+
+    def position(self, x, y):
+        """
+        Returns the flat index of point (x, y), or -1 when it is off the board.
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
+        return -1
+
+    def mask(self, points):
+        """
+        Returns a bitboard of (x, y) points: an int with bit y * width + x
+        set for each one on the board.
+        """
+        bits = 0
+        for x, y in points:
+            p = self.position(x, y)
+            if p >= 0:
+                bits |= 1 << p
+        return bits
+
+    def block_masks(self):
+        """
+        Returns a bitboard per block type, {'A': int, 'B': int, 'C': int},
+        with bit i * width + j set where that block sits.
+        """
+        masks = {'A': 0, 'B': 0, 'C': 0}
+        for q, code in enumerate(self.cells[:-1]):
+            if code >= REFLECT:
+                masks[CELL_TYPES[code]] |= 1 << q
+        return masks
+
+# ==============================
+# STEP 3: Laser Path Simulation
+# ==============================
+def reflect_or_refract(pos, dir, block):
+    """
+    Determines how a lazor reacts to hitting a block.
+    The block may be given as a cell type or as a Board cell code.
+    Returns list of resulting direction(s).
+    """
+    dx, dy = dir
+    x, y = pos
+    if not isinstance(block, str):
+        block = CELL_TYPES[block]
+
+    if block == 'A':  # Reflective
+        if x % 2 == 0:  # Horizontal hit
+            return [(-dx, dy)]
+        else:  # Vertical hit
+            return [(dx, -dy)]
+    elif block == 'B':  # Opaque
+        return []  # Lazor stops
+    elif block == 'C':  # Refractive
+        if x % 2 == 0:
+            return [(dx, dy), (-dx, dy)]  # Reflect and transmit horizontally
+        else:
+            return [(dx, dy), (dx, -dy)]  # Reflect and transmit vertically
+    return [dir]  # No block: continue straight
+
+def build_transitions():
+    """
+    Precomputes reflect_or_refract for every cell code, hit orientation
+    (x % 2) and direction index. The entry for a combination lives at
+    transition_key(code, orientation, direction) and is a tuple of outgoing
+    direction indices, in the same order reflect_or_refract returns them.
+    """
+    table = []
+    for block in CELL_TYPES:
+        for orientation in (0, 1):
+            for direction in DIRECTIONS:
+                out = reflect_or_refract((orientation, 0), direction, block)
+                table.append(tuple(DIRECTION_INDEX[d] for d in out))
+    return table
+
+def transition_key(code, orientation, direction):
+    """
+    Index into TRANSITIONS for a cell code, x % 2 and direction index.
+    """
+    return (code * 2 + orientation) * 9 + direction
+
+def get_block_at(grid, x, y, dx, dy):
+    """
+    Looks ahead in the lazor direction to determine block type.
+    On a Board the block is returned as a cell code.
+    """
+    if isinstance(grid, Board):
+        return grid.cells[grid.look[(y * grid.width + x) * 9 + DIRECTION_INDEX[dx, dy]]]
+    if x % 2 == 0:
+        return grid[y][x + dx] if 0 <= x + dx < len(grid[0]) else 'x'
+    else:
+        return grid[y + dy][x] if 0 <= y + dy < len(grid) else 'x'
+
+def trace(grid, start, direction, touched=None):
+    """
+    Traces the lazor path given a start position and direction.
+    Handles reflections, refractions, and stops.
+    Returns a list of (x, y) positions visited.
+
+    Runs on a Board; a list-of-lists grid is converted first. If a set is
+    passed as touched, every (row, col) cell the beam looks at is added to
+    it. Changing any other cell cannot change the path.
+    """
+    board = grid if isinstance(grid, Board) else Board.from_grid(grid)
+    w, cells, look, step = board.width, board.cells, board.look, board.step
+    sentinel = len(cells) - 1
+    if direction not in DIRECTION_INDEX:
+        raise ValueError(f"Lazor direction must be a unit step, got {direction}")
+
+    path = []
+    queue = collections.deque([(board.position(*start), DIRECTION_INDEX[direction])])
+    seen = set()
+
+    while queue:
+        p, d = queue.popleft()
+        while p >= 0:
+            state = p * 9 + d
+            if state in seen:
+                break  # Avoid infinite loops
+            seen.add(state)
+            x = p % w
+            path.append((x, p // w))
+            q = look[state]
+            if touched is not None and q != sentinel:
+                touched.add(divmod(q, w))
+            # transition_key(cells[q], x % 2, d), inlined
+            interactions = TRANSITIONS[cells[q] * 18 + (x & 1) * 9 + d]
+
+            if len(interactions) > 1:
+                # Split: refractive block
+                queue.append((step[state], interactions[0]))
+                d = interactions[1]
+            elif not interactions:
+                break  # Blocked
+            else:
+                d = interactions[0]
+            p = step[p * 9 + d]
+    return path
+
+def trace_all(grid, lazors, touched=None):
+    """
+    Traces every lazor in a single pass and returns the set of (x, y) points
+    hit by any beam.
+
+    All beams share one deque work queue and one visited map with a byte per
+    (position, direction) state, sized from the board, so a state reached by
+    several lazors is walked once. touched works as in trace.
+    """
+    board = grid if isinstance(grid, Board) else Board.from_grid(grid)
+    w, cells, look, step = board.width, board.cells, board.look, board.step
+    sentinel = len(cells) - 1
+    queue = collections.deque()
+    for start, direction in lazors:
+        if direction not in DIRECTION_INDEX:
+            raise ValueError(f"Lazor direction must be a unit step, got {direction}")
+        queue.append((board.position(*start), DIRECTION_INDEX[direction]))
+
+    visited = bytearray(len(look))
+    hits = set()
+    while queue:
+        p, d = queue.popleft()
+        while p >= 0:
+            state = p * 9 + d
+            if visited[state]:
+                break
+            visited[state] = 1
+            hits.add(p)
+            q = look[state]
+            if touched is not None and q != sentinel:
+                touched.add(divmod(q, w))
+            interactions = TRANSITIONS[cells[q] * 18 + (p % w & 1) * 9 + d]
+
+            if len(interactions) > 1:
+                queue.append((step[state], interactions[0]))
+                d = interactions[1]
+            elif not interactions:
+                break
+            else:
+                d = interactions[0]
+            p = step[p * 9 + d]
+    return {(p % w, p // w) for p in hits}
+
+def trace_bits(grid, lazors):
+    """
+    Bitboard variant of trace_all: returns an int with bit y * width + x set
+    for every point hit by any beam, to be compared against Board.mask.
+    """
+    board = grid if isinstance(grid, Board) else Board.from_grid(grid)
+    w, cells, look, step = board.width, board.cells, board.look, board.step
+    queue = collections.deque()
+    for start, direction in lazors:
+        if direction not in DIRECTION_INDEX:
+            raise ValueError(f"Lazor direction must be a unit step, got {direction}")
+        queue.append((board.position(*start), DIRECTION_INDEX[direction]))
+
+    visited = bytearray(len(look))
+    hits = 0
+    while queue:
+        p, d = queue.popleft()
+        while p >= 0:
+            state = p * 9 + d
+            if visited[state]:
+                break
+            visited[state] = 1
+            hits |= 1 << p
+            interactions = TRANSITIONS[cells[look[state]] * 18 + (p % w & 1) * 9 + d]
+
+            if len(interactions) > 1:
+                queue.append((step[state], interactions[0]))
+                d = interactions[1]
+            elif not interactions:
+                break
+            else:
+                d = interactions[0]
+            p = step[p * 9 + d]
+    return hits
+
+def flanking_cells(point):
+    """
+    Returns the two (row, col) cells that share the edge a target point lies on.
+    A beam can only reach the point by crossing one of them.
+    """
+    x, y = point
+    if x % 2 == 0:
+        return [(y, x - 1), (y, x + 1)]
+    return [(y - 1, x), (y + 1, x)]
+
+def flanking_indices(board, point):
+    """
+    Returns the Board cell indices of the on-board cells flanking a point.
+    """
+    return _flanking_indices(board.width, board.height, point)
+
+@functools.lru_cache(maxsize=4096)
+def _flanking_indices(width, height, point):
+    return tuple(i * width + j for i, j in flanking_cells(point)
+                 if 0 <= i < height and 0 <= j < width)
+
+def target_blocked(board, point, lazors):
+    """
+    Checks whether both cells flanking a target are off the board or hold a
+    block a beam cannot cross (A or B), so no beam can ever reach it.
+
+    The cells flanking a lazor origin are the exception: a beam reflected on
+    its very first step travels back through the cell behind the origin
+    without ever looking at it.
+    """
+    origin_cells = {q for pos, _ in lazors for q in flanking_indices(board, pos)}
+    return all(board.cells[q] in (REFLECT, OPAQUE) and q not in origin_cells
+               for q in flanking_indices(board, point))
+
+def unreachable_targets(board, lazors, targets):
+    """
+    Returns the targets no beam can reach on this board, without tracing:
+    points off the board, points whose x + y parity no diagonal lazor can
+    ever have, and points walled in as described in target_blocked.
+    A target sitting on a lazor origin is always reachable.
+    """
+    origins = {pos for pos, _ in lazors}
+    parities = {(x + y) % 2 for (x, y), (dx, dy) in lazors}
+    diagonal = all(dx and dy for _, (dx, dy) in lazors)
+    unreachable = []
+    for t in targets:
+        if t in origins and board.position(*t) >= 0:
+            continue
+        if (board.position(*t) < 0 or (diagonal and sum(t) % 2 not in parities)
+                or target_blocked(board, t, lazors)):
+            unreachable.append(t)
+    return unreachable
+
+def trace_targets(grid, lazors, targets):
+    """
+    Traces every lazor until all targets are covered and returns the targets
+    that were missed, so an empty list means success.
+
+    Unlike trace_all this stops the moment the last target is hit. If any
+    target is off the board or walled in (see target_blocked) it returns just
+    those targets straight away, without walking a single beam.
+    """
+    board = grid if isinstance(grid, Board) else Board.from_grid(grid)
+    w, cells, look, step = board.width, board.cells, board.look, board.step
+    starts, positions, walls = _target_plan(w, board.height, tuple(lazors), tuple(targets))
+    unreachable = [t for t, p in zip(targets, positions) if p < 0]
+    for t, flanks in walls:
+        if all(cells[q] == REFLECT or cells[q] == OPAQUE for q in flanks):
+            unreachable.append(t)
+    if unreachable or not positions:
+        return unreachable
+
+    pending = 0
+    for p in positions:
+        pending |= 1 << p
+    queue = collections.deque(starts)
+    visited = bytearray(len(look))
+    while queue:
+        p, d = queue.popleft()
+        while p >= 0:
+            state = p * 9 + d
+            if visited[state]:
+                break
+            visited[state] = 1
+            if pending >> p & 1:
+                pending ^= 1 << p
+                if not pending:
+                    return []
+            interactions = TRANSITIONS[cells[look[state]] * 18 + (p % w & 1) * 9 + d]
+
+            if len(interactions) > 1:
+                queue.append((step[state], interactions[0]))
+                d = interactions[1]
+            elif not interactions:
+                break
+            else:
+                d = interactions[0]
+            p = step[p * 9 + d]
+    return [t for t, p in zip(targets, positions) if pending >> p & 1]
+
+class IncrementalTracer:
+    """
+    Traces every lazor on a Board, like trace_all, and keeps a log of the
+    walk so that changing one cell only re-simulates what that cell affects.
+
+    Each logged step records its (position, direction) state, the cell it
+    looked at and where the branch queue stood. The walk is deterministic,
+    so when a cell changes everything before the first step that looked at
+    it is still valid. The tracer rewinds to that step and walks on from
+    there, which gives exactly what a full re-trace of the board would.
+    Changes can be taken back in reverse order with undo, which puts the
+    old tail of the log back without walking it again.
+    """
+    UNSEEN = -1
+
+    def __init__(self, board, lazors, targets=()):
+        self.board = board
+        self.targets = list(targets)
+        self._target_positions = [board.position(*t) for t in self.targets]
+        self._is_target = bytearray(len(board.cells))
+        for p in self._target_positions:
+            if p >= 0:
+                self._is_target[p] = 1
+        self._covered = 0
+
+        self._visited = bytearray(len(board.look))
+        self._hit_count = [0] * len(board.cells)
+        self._first_look = [self.UNSEEN] * len(board.cells)
+        # One (state, cell looked at, branches taken, branches queued) per step
+        self._log = []
+        # Branch starts in the order they were queued, and how many were taken
+        self._branches = []
+        self._read = 0
+        self._undo = []
+        for start, direction in lazors:
+            if direction not in DIRECTION_INDEX:
+                raise ValueError(f"Lazor direction must be a unit step, got {direction}")
+            self._branches.append((board.position(*start), DIRECTION_INDEX[direction]))
+        self._walk(-1, 0)
+
+    def _walk(self, p, d):
+        """
+        Continues the beam at (p, d), then every queued branch, logging steps.
+        """
+        w, cells, look, step = self.board.width, self.board.cells, self.board.look, self.board.step
+        visited, hit_count, first_look = self._visited, self._hit_count, self._first_look
+        log, branches, is_target = self._log, self._branches, self._is_target
+        unseen = self.UNSEEN
+        while True:
+            while p >= 0:
+                state = p * 9 + d
+                if visited[state]:
+                    break
+                visited[state] = 1
+                q = look[state]
+                if first_look[q] == unseen:
+                    first_look[q] = len(log)
+                log.append((state, q, self._read, len(branches)))
+                hit_count[p] += 1
+                if hit_count[p] == 1 and is_target[p]:
+                    self._covered += 1
+
+                interactions = TRANSITIONS[cells[q] * 18 + (p % w & 1) * 9 + d]
+                if len(interactions) > 1:
+                    branches.append((step[state], interactions[0]))
+                    d = interactions[1]
+                elif not interactions:
+                    break
+                else:
+                    d = interactions[0]
+                p = step[p * 9 + d]
+            if self._read == len(branches):
+                return
+            p, d = branches[self._read]
+            self._read += 1
+
+    def _rewind(self, k):
+        """
+        Cuts steps k onwards from the log and restores the walk state as it
+        was just before step k. Returns the cut steps and queued branches.
+        """
+        visited, hit_count, first_look, is_target = (self._visited, self._hit_count,
+                                                     self._first_look, self._is_target)
+        tail = self._log[k:]
+        for state, q, _, _ in tail:
+            visited[state] = 0
+            p = state // 9
+            hit_count[p] -= 1
+            if hit_count[p] == 0 and is_target[p]:
+                self._covered -= 1
+            if first_look[q] >= k:
+                first_look[q] = self.UNSEEN
+        _, _, self._read, queued = tail[0]
+        branches = self._branches[queued:]
+        del self._log[k:]
+        del self._branches[queued:]
+        return tail, branches
+
+    def set(self, i, j, block):
+        """
+        Puts block (a cell type) at row i, column j and updates the beams.
+        """
+        q = i * self.board.width + j
+        code = CELL_CODES[block]
+        old = self.board.cells[q]
+        self.board.cells[q] = code
+        k = self._first_look[q]
+        if k == self.UNSEEN or old == code:
+            self._undo.append((q, old, None))
+            return
+        tail, branches = self._rewind(k)
+        self._undo.append((q, old, (k, tail, branches)))
+        state = tail[0][0]
+        self._walk(state // 9, state % 9)
+
+    def undo(self):
+        """
+        Takes back the most recent set that has not been undone.
+        """
+        q, old, saved = self._undo.pop()
+        self.board.cells[q] = old
+        if saved is None:
+            return
+        k, tail, branches = saved
+        self._rewind(k)
+        visited, hit_count, first_look, is_target = (self._visited, self._hit_count,
+                                                     self._first_look, self._is_target)
+        for n, (state, q, _, _) in enumerate(tail, k):
+            visited[state] = 1
+            p = state // 9
+            hit_count[p] += 1
+            if hit_count[p] == 1 and is_target[p]:
+                self._covered += 1
+            if first_look[q] == self.UNSEEN:
+                first_look[q] = n
+        self._log.extend(tail)
+        self._branches.extend(branches)
+        self._read = len(self._branches)
+
+    def looks_at(self, i, j):
+        """
+        Checks whether any beam currently looks at row i, column j.
+        """
+        return self._first_look[i * self.board.width + j] != self.UNSEEN
+
+    def first_look(self, i, j):
+        """
+        Returns how many beam steps come before the first one that looks at
+        row i, column j, or UNSEEN if no beam looks at it.
+        """
+        return self._first_look[i * self.board.width + j]
+
+    def touched(self):
+        """
+        Returns the set of (row, col) cells the beams currently look at.
+        """
+        w = self.board.width
+        return {divmod(q, w) for q, k in enumerate(self._first_look[:-1]) if k != self.UNSEEN}
+
+    def hits(self):
+        """
+        Returns the set of (x, y) points the beams currently pass through.
+        """
+        w = self.board.width
+        return {(p % w, p // w) for p, n in enumerate(self._hit_count) if n}
+
+    def missing(self):
+        """
+        Returns the targets no beam currently hits.
+        """
+        if self._covered == len(set(self._target_positions)):
+            return []
+        return [t for t, p in zip(self.targets, self._target_positions)
+                if p < 0 or not self._hit_count[p]]
+
+@functools.lru_cache(maxsize=256)
+def _target_plan(width, height, lazors, targets):
+    """
+    Precomputes what trace_targets needs for one board size and level:
+    the lazor start states, each target's position index and, for targets
+    that could be walled in, the flanking cells that must all be A or B.
+    """
+    board = Board(width, height)
+    starts = []
+    for start, direction in lazors:
+        if direction not in DIRECTION_INDEX:
+            raise ValueError(f"Lazor direction must be a unit step, got {direction}")
+        starts.append((board.position(*start), DIRECTION_INDEX[direction]))
+    origins = {p for p, _ in starts}
+    origin_cells = {q for pos, _ in lazors for q in flanking_indices(board, pos)}
+    positions = tuple(board.position(*t) for t in targets)
+    walls = []
+    for t, p in zip(targets, positions):
+        flanks = flanking_indices(board, t)
+        if p >= 0 and p not in origins and not origin_cells.intersection(flanks):
+            walls.append((t, flanks))
+    return tuple(starts), positions, tuple(walls)
+
+TRANSITIONS = build_transitions()
+
+# ===============================
+# STEP 4: Brute Force Permutator
+# ===============================
+def find_block_positions(grid):
+    """
+    Returns all positions in the grid where a movable block ('o') can be placed.
+    """
+    return [(i, j) for i in range(len(grid)) for j in range(len(grid[0])) if grid[i][j] == 'o']
+
+def multiset_permutations(items):
+    """
+    Yields each distinct ordering of items exactly once, in lexicographic order.
+    Unlike set(itertools.permutations(...)), repeated items are never expanded,
+    so memory stays constant no matter how many identical blocks there are.
+    """
+    perm = sorted(items)
+    n = len(perm)
+    while True:
+        yield tuple(perm)
+        # Find the rightmost item that is smaller than its successor
+        i = n - 2
+        while i >= 0 and perm[i] >= perm[i + 1]:
+            i -= 1
+        if i < 0:
+            return
+        # Swap it with the rightmost larger item, then reverse the tail
+        j = n - 1
+        while perm[j] <= perm[i]:
+            j -= 1
+        perm[i], perm[j] = perm[j], perm[i]
+        perm[i + 1:] = reversed(perm[i + 1:])
+
+def count_placements(num_slots, blocks):
+    """
+    Returns how many distinct block placements exist for the given slot count.
+    """
+    k = blocks['A'] + blocks['B'] + blocks['C']
+    if k > num_slots:
+        return 0
+    arrangements = math.factorial(k)
+    for b in 'ABC':
+        arrangements //= math.factorial(blocks[b])
+    return math.comb(num_slots, k) * arrangements
+
+def iter_placements(slots, blocks, start=0, stop=None):
+    """
+    Lazily yields every distinct assignment of movable blocks to slots, each
+    exactly once, as a tuple of ((row, col), block) pairs.
+
+    start and stop restrict the walk to that range of slot combinations (in
+    itertools.combinations order), which lets the enumeration be split into
+    contiguous shards.
+    """
+    all_blocks = ['A'] * blocks['A'] + ['B'] * blocks['B'] + ['C'] * blocks['C']
+    combos = itertools.combinations(slots, len(all_blocks))
+    for slot_combo in itertools.islice(combos, start, stop):
+        for perm in multiset_permutations(all_blocks):
+            yield tuple(zip(slot_combo, perm))
+
+def place_blocks(grid, placement):
+    """
+    Writes a placement's blocks into the grid (or Board) in place.
+    """
+    if isinstance(grid, Board):
+        w, cells = grid.width, grid.cells
+        for (i, j), b in placement:
+            cells[i * w + j] = CELL_CODES[b]
+        return
+    for (i, j), b in placement:
+        grid[i][j] = b
+
+def remove_blocks(grid, placement):
+    """
+    Undoes place_blocks, turning the placement's cells back into open slots.
+    """
+    place_blocks(grid, [(cell, 'o') for cell, _ in placement])
+
+def place_masks(board, masks):
+    """
+    Writes bitboards of blocks, {'A': int, ...} as from generate_block_masks,
+    into a Board in place.
+    """
+    cells = board.cells
+    for block, mask in masks.items():
+        code = CELL_CODES[block]
+        while mask:
+            low = mask & -mask
+            cells[low.bit_length() - 1] = code
+            mask ^= low
+
+def generate_block_masks(grid, blocks):
+    """
+    Bitboard variant of generate_block_grids: yields each placement, in
+    iter_placements order, as {'A': int, 'B': int, 'C': int} with bit
+    row * width + col set for every block of that type. A placement is
+    just the OR of its slots' bits.
+    """
+    w = len(grid[0])
+    slots = find_block_positions(grid)
+    bits = {slot: 1 << (slot[0] * w + slot[1]) for slot in slots}
+    for placement in iter_placements(slots, blocks):
+        masks = {'A': 0, 'B': 0, 'C': 0}
+        for slot, b in placement:
+            masks[b] |= bits[slot]
+        yield masks
+
+def generate_block_grids(grid, blocks, inplace=False, lazors=None, targets=None):
+    """
+    Generator that yields all valid block configurations for given slots.
+    Each distinct placement of the movable blocks is produced exactly once.
+
+    If the lazors are given, slots no beam can reach are only used as dump
+    slots, filled once with whatever blocks are left over (see
+    iter_live_placements), which shrinks the enumeration accordingly. If
+    the targets are given too, only placements that respect the slot
+    domains the targets imply are produced (see iter_constrained_placements).
+
+    With inplace=True a single working board is yielded over and over, with
+    the previous placement undone and the next one written in before each
+    yield. Callers must copy the board if they need to keep a configuration.
+    """
+    if lazors is None:
+        placements = iter_placements(find_block_positions(grid), blocks)
+    elif targets is None:
+        placements = iter_live_placements(grid, blocks, lazors)
+    else:
+        placements = iter_constrained_placements(grid, blocks, lazors, targets)
+    if not inplace:
+        for placement in placements:
+            g = [row[:] for row in grid]
+            place_blocks(g, placement)
+            yield g
+        return
+
+    board = [row[:] for row in grid]
+    previous = ()
+    for placement in placements:
+        remove_blocks(board, previous)
+        place_blocks(board, placement)
+        previous = placement
+        yield board
+    remove_blocks(board, previous)
+
+# ======================
+# STEP 5: Slot Analysis
+# ======================
+def reachable_cells(grid, lazors, blocks=None):
+    """
+    Over-approximates, over every possible block placement, the set of
+    (row, col) cells a lazor can ever look at. An open slot may hold any
+    block, so a beam that looks at one carries on in every direction a block
+    could send it. A block in a slot outside this set can never change a path.
+
+    Given the block counts, only what those blocks can do is considered: a
+    beam passes straight through a slot only if some slot can stay empty or
+    there is a C block, and reflects only if there is an A or C block.
+    """
+    board = Board.from_grid(grid)
+    if blocks is None:
+        can_pass = can_reflect = True
+    else:
+        num_slots = len(find_block_positions(grid))
+        can_pass = blocks['C'] > 0 or sum(blocks.values()) < num_slots
+        can_reflect = blocks['A'] > 0 or blocks['C'] > 0
+    w, cells, look, step = board.width, board.cells, board.look, board.step
+    sentinel = len(cells) - 1
+    queue = collections.deque(
+        (board.position(*start), DIRECTION_INDEX[direction]) for start, direction in lazors)
+    visited = bytearray(len(look))
+    reached = set()
+    while queue:
+        p, d = queue.popleft()
+        if p < 0 or visited[p * 9 + d]:
+            continue
+        state = p * 9 + d
+        visited[state] = 1
+        q = look[state]
+        reached.add(q)
+        orientation = p % w & 1
+        if cells[q] == OPEN:
+            outcomes = set()
+            if can_pass:
+                outcomes.update(TRANSITIONS[transition_key(OPEN, orientation, d)])
+            if can_reflect:
+                outcomes.update(TRANSITIONS[transition_key(REFLECT, orientation, d)])
+        else:
+            outcomes = TRANSITIONS[transition_key(cells[q], orientation, d)]
+        for out in outcomes:
+            queue.append((step[p * 9 + out], out))
+    return {divmod(q, w) for q in reached if q != sentinel}
+
+# The eight symmetries of a rectangle, as (transpose, flip x, flip y)
+TRANSFORMS = tuple(itertools.product((False, True), repeat=3))
+
+def transform_point(transform, width, height, point):
+    """
+    Maps an (x, y) point through one of TRANSFORMS. Transposing only makes
+    sense on a square grid.
+    """
+    transpose, flip_x, flip_y = transform
+    x, y = point
+    if transpose:
+        x, y = y, x
+    return (width - 1 - x if flip_x else x), (height - 1 - y if flip_y else y)
+
+def transform_direction(transform, direction):
+    """
+    Maps a lazor direction through one of TRANSFORMS.
+    """
+    transpose, flip_x, flip_y = transform
+    dx, dy = direction
+    if transpose:
+        dx, dy = dy, dx
+    return (-dx if flip_x else dx), (-dy if flip_y else dy)
+
+def board_symmetries(grid, lazors, targets):
+    """
+    Returns the TRANSFORMS that map the level onto itself: every cell keeps
+    its type, and the sets of lazors (with their directions) and of targets
+    are unchanged. Tracing commutes with these transforms, so a placement and
+    its image hit the same targets. The identity always comes first.
+
+    Transposes are only considered for square grids whose lazors are all
+    diagonal beams starting on an edge, where the x-edge/y-edge rules of
+    get_block_at swap cleanly.
+    """
+    h, w = len(grid), len(grid[0])
+    lazor_set = {(tuple(pos), tuple(direction)) for pos, direction in lazors}
+    target_set = {tuple(t) for t in targets}
+    diagonal = all(dx and dy and (x + y) % 2 for (x, y), (dx, dy) in lazor_set)
+    symmetries = []
+    for t in TRANSFORMS:
+        if t[0] and (w != h or not diagonal):
+            continue
+        if any(grid[y][x] != grid[ty][tx] for y in range(h) for x in range(w)
+               for tx, ty in [transform_point(t, w, h, (x, y))]):
+            continue
+        if {(transform_point(t, w, h, pos), transform_direction(t, d)) for pos, d in lazor_set} != lazor_set:
+            continue
+        if {transform_point(t, w, h, p) for p in target_set} != target_set:
+            continue
+        symmetries.append(t)
+    return symmetries
+
+def slot_classes(grid, lazors, targets, blocks=None):
+    """
+    Splits the movable slots into classes of equivalent slots, using the
+    block counts (if given) to sharpen reachable_cells.
+
+    Returns (dead, orbits, symmetries):
+        - dead: slots outside reachable_cells. They are interchangeable, and
+          a block there never matters, only how many blocks end up there
+        - orbits: the other slots, grouped by the level's symmetries
+        - symmetries: the transforms found by board_symmetries
+    """
+    h, w = len(grid), len(grid[0])
+    reached = reachable_cells(grid, lazors, blocks)
+    symmetries = board_symmetries(grid, lazors, targets)
+    dead, orbits, seen = [], [], set()
+    for i, j in find_block_positions(grid):
+        if (i, j) not in reached:
+            dead.append((i, j))
+        elif (i, j) not in seen:
+            orbit = sorted({transform_point(t, w, h, (j, i))[::-1] for t in symmetries})
+            seen.update(orbit)
+            orbits.append(orbit)
+    return dead, orbits, symmetries
+
+def _live_block_splits(blocks, num_dead):
+    """
+    Returns (live, dead) block-count dicts for every way of sending some of
+    the blocks to the dead slots, most live blocks first.
+    """
+    total = sum(blocks.values())
+    splits = []
+    for a in range(blocks['A'] + 1):
+        for b in range(blocks['B'] + 1):
+            for c in range(blocks['C'] + 1):
+                if total - (a + b + c) <= num_dead:
+                    live = {'A': a, 'B': b, 'C': c}
+                    splits.append((live, {k: blocks[k] - live[k] for k in 'ABC'}))
+    splits.sort(key=lambda split: -sum(split[0].values()))
+    return splits
+
+def _live_dead_placements(live, dead, blocks):
+    """
+    Yields (live part, dead part) for every placement that puts some of the
+    blocks on live slots and dumps the rest on dead slots in one fixed way.
+    """
+    for live_blocks, dead_blocks in _live_block_splits(blocks, len(dead)):
+        dead_part = tuple(zip(dead, ''.join(b * dead_blocks[b] for b in 'ABC')))
+        for placement in iter_placements(live, live_blocks):
+            yield placement, dead_part
+
+def split_slots(grid, blocks, lazors):
+    """
+    Splits the movable slots into (live, dead): those a beam might reach
+    with these blocks, according to reachable_cells, and the rest.
+    """
+    reached = reachable_cells(grid, lazors, blocks)
+    slots = find_block_positions(grid)
+    return [s for s in slots if s in reached], [s for s in slots if s not in reached]
+
+def iter_live_placements(grid, blocks, lazors):
+    """
+    Like iter_placements, but only the slots a beam might reach are
+    enumerated, with as many blocks as possible on them first. Leftover
+    blocks are dumped on the unreachable slots once, in a fixed way, since
+    they can never change a path there.
+    """
+    live, dead = split_slots(grid, blocks, lazors)
+    for live_part, dead_part in _live_dead_placements(live, dead, blocks):
+        yield live_part + dead_part
+
+def count_live_placements(grid, blocks, lazors):
+    """
+    Returns how many placements iter_live_placements yields.
+    """
+    live, dead = split_slots(grid, blocks, lazors)
+    return sum(count_placements(len(live), live_blocks)
+               for live_blocks, _ in _live_block_splits(blocks, len(dead)))
+
+def slot_domains(grid, lazors, targets, blocks):
+    """
+    Propagates what the targets demand of the slots, before any tracing.
+
+    A beam can only reach a target by crossing one of its two flanking cells
+    (see target_blocked), so at least one of them must end up without an A
+    or B block. Cells flanking a lazor origin always count as crossable, and
+    a target on an origin needs nothing. When only one flank is a slot that
+    could be crossed, that slot must stay open or take a C block (or stay
+    open, if there are no C blocks); when both are, the pair is kept as a
+    constraint on the two slots together.
+
+    Returns None if some target can never be reached, otherwise
+    (domains, pairs):
+        - domains: {slot: blocks it may hold}, 'ABC', 'C' or '' (forced empty)
+        - pairs: (slot, slot) pairs of which at least one must not hold A or B
+    """
+    board = Board.from_grid(grid)
+    if unreachable_targets(board, lazors, targets):
+        return None
+    slots = find_block_positions(grid)
+    domains = {slot: 'ABC' for slot in slots}
+    pairs = []
+    if not blocks['A'] and not blocks['B']:
+        return domains, pairs
+    origins = {pos for pos, _ in lazors}
+    origin_cells = {q for pos in origins for q in flanking_indices(board, pos)}
+    w = board.width
+    for t in targets:
+        flanks = flanking_indices(board, t)
+        if t in origins or origin_cells.intersection(flanks):
+            continue
+        if any(board.cells[q] in (FIXED, REFRACT) for q in flanks):
+            continue
+        free = [divmod(q, w) for q in flanks if board.cells[q] == OPEN]
+        if len(free) == 1:
+            domains[free[0]] = 'C' if blocks['C'] else ''
+        elif len(free) == 2:
+            pairs.append(tuple(free))
+    # A pair with a slot that can no longer block is already satisfied
+    pairs = [(s, t) for s, t in pairs if domains[s] == 'ABC' and domains[t] == 'ABC']
+    return domains, pairs
+
+def iter_constrained_placements(grid, blocks, lazors, targets, order='row'):
+    """
+    Like iter_placements, but only yields placements that respect
+    slot_domains: forced-empty slots are never used, slots limited to C get
+    only C blocks, and no constrained pair gets two blocking blocks. The
+    slots are combined in the given order (see order_slots).
+    """
+    constraints = slot_domains(grid, lazors, targets, blocks)
+    if constraints is None:
+        return
+    domains, pairs = constraints
+    slots = [s for s in order_slots(grid, lazors, targets, order) if domains[s]]
+    limited_slots = {s for s in slots if domains[s] == 'C'}
+    perms = list(multiset_permutations('A' * blocks['A'] + 'B' * blocks['B'] + 'C' * blocks['C']))
+    for combo in itertools.combinations(slots, sum(blocks.values())):
+        chosen = set(combo)
+        both = [(s, t) for s, t in pairs if s in chosen and t in chosen]
+        if not both and limited_slots.isdisjoint(chosen):
+            for perm in perms:
+                yield tuple(zip(combo, perm))
+            continue
+        limited = [s for s in combo if s in limited_slots]
+        # Each pair both filled needs a C, so there must be one left over
+        if len(limited) > blocks['C'] or (both and len(limited) == blocks['C']):
+            continue
+        free = [s for s in combo if s not in limited_slots]
+        rest = {'A': blocks['A'], 'B': blocks['B'], 'C': blocks['C'] - len(limited)}
+        limited_part = tuple((s, 'C') for s in limited)
+        both = [(free.index(s), free.index(t)) for s, t in both]
+        for perm in multiset_permutations(''.join(b * rest[b] for b in 'ABC')):
+            if any(perm[i] != 'C' and perm[j] != 'C' for i, j in both):
+                continue
+            yield limited_part + tuple(zip(free, perm))
+
+def _slot_distance(slot, points):
+    """
+    Returns the distance, in half-cells, from a (row, col) slot to the
+    nearest of some (x, y) points, or 0 if there are none.
+    """
+    i, j = slot
+    return min((max(abs(j - x), abs(i - y)) for x, y in points), default=0)
+
+def _beam_order(grid, lazors, targets, slots):
+    """
+    Slots the beams of the empty board look at, in the order they reach
+    them, then the rest by distance from the beams.
+    """
+    tracer = IncrementalTracer(Board.from_grid(grid), lazors)
+    hits = tracer.hits()
+    reached = [s for s in slots if tracer.looks_at(*s)]
+    reached.sort(key=lambda s: tracer.first_look(*s))
+    rest = sorted((s for s in slots if not tracer.looks_at(*s)), key=lambda s: _slot_distance(s, hits))
+    return reached + rest
+
+def _target_order(grid, lazors, targets, slots):
+    """
+    Slots nearest a target first.
+    """
+    return sorted(slots, key=lambda s: _slot_distance(s, targets))
+
+def _constrained_order(grid, lazors, targets, slots):
+    """
+    Slots with the fewest options under slot_domains first, forced-empty
+    slots last, and otherwise in beam order.
+    """
+    constraints = slot_domains(grid, lazors, targets, {'A': 1, 'B': 1, 'C': 1})
+    if constraints is None:
+        return slots
+    domains, pairs = constraints
+    paired = {s for pair in pairs for s in pair}
+    rank = {s: n for n, s in enumerate(_beam_order(grid, lazors, targets, slots))}
+    return sorted(slots, key=lambda s: (not domains[s], len(domains[s]), s not in paired, rank[s]))
+
+SLOT_ORDERS = {
+    'row': lambda grid, lazors, targets, slots: slots,
+    'beam': _beam_order,
+    'target': _target_order,
+    'constrained': _constrained_order,
+}
+
+def order_slots(grid, lazors, targets, order='row'):
+    """
+    Returns the movable slots in the order of one of the SLOT_ORDERS
+    heuristics, which is the order the searches try them in:
+        - row: row-major, as find_block_positions returns them
+        - beam: the order the beams of the empty board reach them
+        - target: nearest a target first
+        - constrained: fewest options first (see slot_domains); the
+          backtracking search also re-sorts its candidates at every
+          step by distance to the targets still missed
+    """
+    if order not in SLOT_ORDERS:
+        raise ValueError(f"Unknown slot order {order!r}")
+    return SLOT_ORDERS[order](grid, lazors, targets, find_block_positions(grid))
+
+def _slot_maps(grid, live, symmetries):
+    """
+    Returns, for each non-identity symmetry, a dict mapping every live slot
+    to its image.
+    """
+    h, w = len(grid), len(grid[0])
+    return [{(i, j): transform_point(t, w, h, (j, i))[::-1] for i, j in live}
+            for t in symmetries if t != (False, False, False)]
+
+def iter_reduced_placements(grid, blocks, lazors, targets):
+    """
+    Like iter_placements, but yields one placement per class of equivalent
+    placements. The dead slots from slot_classes are filled in one fixed way,
+    whatever mix of blocks they get. Of the placements on the remaining slots
+    that the level's symmetries map onto each other, only the
+    lexicographically smallest is kept.
+    """
+    dead, orbits, symmetries = slot_classes(grid, lazors, targets, blocks)
+    live = sorted(s for orbit in orbits for s in orbit)
+    maps = _slot_maps(grid, live, symmetries)
+    for placement, dead_part in _live_dead_placements(live, dead, blocks):
+        if any(tuple(sorted((m[s], b) for s, b in placement)) < placement for m in maps):
+            continue
+        yield placement + dead_part
+
+def _count_invariant(cycles, live_blocks):
+    """
+    Counts the placements of exactly live_blocks that are constant on each
+    cycle of a slot permutation, i.e. that the permutation leaves unchanged.
+    """
+    target = (live_blocks['A'], live_blocks['B'], live_blocks['C'])
+    ways = collections.Counter({(0, 0, 0): 1})
+    for length in cycles:
+        grown = collections.Counter(ways)
+        for (a, b, c), n in ways.items():
+            for k, used in enumerate((a, b, c)):
+                if used + length <= target[k]:
+                    counts = [a, b, c]
+                    counts[k] += length
+                    grown[tuple(counts)] += n
+        ways = grown
+    return ways[target]
+
+def reduction_report(grid, blocks, lazors, targets):
+    """
+    Summarizes how much of the search space iter_reduced_placements removes.
+    The reduced count uses Burnside's lemma over the symmetries, so it is
+    exact without enumerating anything.
+    """
+    slots = find_block_positions(grid)
+    dead, orbits, symmetries = slot_classes(grid, lazors, targets, blocks)
+    live = sorted(s for orbit in orbits for s in orbit)
+    cycle_lengths = [[1] * len(live)]
+    for m in _slot_maps(grid, live, symmetries):
+        lengths, seen = [], set()
+        for s in live:
+            n = 0
+            while s not in seen:
+                seen.add(s)
+                s = m[s]
+                n += 1
+            if n:
+                lengths.append(n)
+        cycle_lengths.append(lengths)
+
+    reduced = 0
+    for live_blocks, _ in _live_block_splits(blocks, len(dead)):
+        fixed = sum(_count_invariant(cycles, live_blocks) for cycles in cycle_lengths)
+        reduced += fixed // len(cycle_lengths)
+    placements = count_placements(len(slots), blocks)
+    return {
+        'placements': placements,
+        'reduced': reduced,
+        'dead_slots': len(dead),
+        'slot_classes': len(orbits) + bool(dead),
+        'symmetries': len(symmetries),
+        'eliminated': 1 - reduced / placements if placements else 0.0,
+    }
+
+# =====================
+# STEP 6: Check & Draw
+# =====================
+def all_points_hit(path_list, targets):
+    """
+    Checks if all target points have been hit by any lazor path.
+    A set of hit points, as returned by trace_all, is used as is. A hit
+    bitboard from trace_bits is compared against a targets bitboard from
+    Board.mask in a single AND.
+    """
+    if isinstance(path_list, int):
+        return path_list & targets == targets
+    if isinstance(path_list, (set, frozenset)):
+        all_hits = path_list
+    else:
+        all_hits = set()
+        for p in path_list:
+            all_hits.update(p)
+    return all(t in all_hits for t in targets)
+
+def _numpy():
+    """
+    Imports NumPy for the batch evaluator, which is the only part that needs it.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Batch evaluation needs NumPy: pip install numpy") from None
+    return numpy
+
+@functools.lru_cache(maxsize=32)
+def _batch_tables(width, height):
+    """
+    NumPy versions of the board tables for evaluate_batch: look, and succ,
+    where succ[code, state] holds the (up to two) states a beam moves on to
+    from that state when the cell it looks at holds code, -1 for none.
+    """
+    np = _numpy()
+    look, step = board_tables(width, height)
+    succ = np.full((len(CELL_TYPES), len(look), 2), -1, dtype=np.int64)
+    for code in range(len(CELL_TYPES)):
+        for state in range(len(look)):
+            p, d = divmod(state, 9)
+            for k, e in enumerate(TRANSITIONS[transition_key(code, p % width % 2, d)]):
+                if step[p * 9 + e] >= 0:
+                    succ[code, state, k] = step[p * 9 + e] * 9 + e
+    return np.array(look, dtype=np.int64), succ
+
+def _lazor_states(board, lazors):
+    """
+    Returns the start state (position * 9 + direction) of every on-board lazor.
+    """
+    states = []
+    for start, direction in lazors:
+        if direction not in DIRECTION_INDEX:
+            raise ValueError(f"Lazor direction must be a unit step, got {direction}")
+        p = board.position(*start)
+        if p >= 0:
+            states.append(p * 9 + DIRECTION_INDEX[direction])
+    return states
+
+def _evaluate_stacked(board, starts, positions, stacked):
+    """
+    Runs every beam on a stack of boards, one row of cell codes per board,
+    and returns which boards hit every target position.
+    """
+    np = _numpy()
+    look, succ = _batch_tables(board.width, board.height)
+    n, n_states, n_cells = len(stacked), len(look), stacked.shape[1]
+    flat_cells = stacked.ravel()
+    boards = np.repeat(np.arange(n, dtype=np.int64), len(starts))
+    states = np.tile(np.array(starts, dtype=np.int64), n)
+
+    # Beams that meet in the same round walk on together until they reach a
+    # visited state; that costs a little work but never changes the result
+    visited = np.zeros(n * n_states, dtype=bool)
+    while states.size:
+        flat = boards * n_states + states
+        fresh = ~visited[flat]
+        boards, states = boards[fresh], states[fresh]
+        visited[flat[fresh]] = True
+        nxt = succ[flat_cells[boards * n_cells + look[states]], states]
+        moving = nxt >= 0
+        boards = np.repeat(boards, 2).reshape(-1, 2)[moving]
+        states = nxt[moving]
+
+    hit = visited.reshape(n, n_states // 9, 9)[:, positions, :].any(axis=2)
+    return hit.all(axis=1)
+
+def evaluate_batch(grid, lazors, targets, placements):
+    """
+    Checks a batch of placements on a board at once with NumPy and returns
+    a boolean vector: True where the placement hits every target.
+
+    The boards are stacked into one array of cell codes, a row per board,
+    and every beam of every board advances in lockstep, one step per round,
+    as arrays of (board, state) pairs. Memory grows with len(placements)
+    times the number of beam states, so callers pick the batch size.
+    """
+    np = _numpy()
+    board = grid if isinstance(grid, Board) else Board.from_grid(grid)
+    positions = [board.position(*t) for t in targets]
+    n = len(placements)
+    if n == 0 or any(p < 0 for p in positions):
+        return np.zeros(n, dtype=bool)
+
+    stacked = np.tile(np.frombuffer(bytes(board.cells), dtype=np.uint8), (n, 1))
+    if placements[0]:
+        w = board.width
+        slots = np.array([[i * w + j for (i, j), _ in pl] for pl in placements], dtype=np.int64)
+        blocks = np.array([[CELL_CODES[b] for _, b in pl] for pl in placements], dtype=np.uint8)
+        np.put_along_axis(stacked, slots, blocks, axis=1)
+    return _evaluate_stacked(board, _lazor_states(board, lazors), positions, stacked)
+
+def draw_solution(grid, lazors, paths, targets, filename):
+    """
+    Draws and saves the solution as an image (with blocks, paths, and targets).
+    """
+    from PIL import Image, ImageDraw
+
+    size = 40
+    w, h = len(grid[0]), len(grid)
+    img = Image.new('RGB', (w*size, h*size), color=(30, 30, 30))
+    draw = ImageDraw.Draw(img)
+
+    # Colors for each cell type
+    colors = {'A': (255,255,255), 'B': (0,0,0), 'C': (0,255,0), 'o': (100,100,100), 'x': (50,50,50)}
+
+    for y in range(h):
+        for x in range(w):
+            cell = grid[y][x]
+            c = colors.get(cell, (30,30,30))
+            draw.rectangle([x*size, y*size, (x+1)*size, (y+1)*size], fill=c)
+
+    # Optional: draw lazor paths and target points
+    # Uncomment below if desired
+    # for path in paths:
+    #     for i in range(len(path)-1):
+    #         x1, y1 = path[i]
+    #         x2, y2 = path[i+1]
+    #         draw.line([(x1*size//2, y1*size//2), (x2*size//2, y2*size//2)], fill=(255,0,0), width=3)
+    #
+    # for x, y in targets:
+    #     px = x * size / 2
+    #     py = y * size / 2
+    #     draw.ellipse([(px - 6, py - 6), (px + 6, py + 6)], fill=(255, 255, 0), outline=(255, 0, 0), width=2)
+
+    img.save(filename)
+    print(f"✅ Solution saved to {filename}")
+
+# ===========================
+# STEP 7: Search Strategies
+# ===========================
+def solve_brute_force(grid, blocks, lazors, targets, start=0, stop=None, cancel=None, order='row'):
+    """
+    Tries every placement in generate_block_grids order on one Board, with
+    the slots in the given order (see order_slots).
+    Returns (solved grid or None, number of candidates traced).
+
+    start and stop limit the search to a range of slot combinations, as in
+    iter_placements. cancel, if given, is polled every 1024 candidates and
+    the search gives up as soon as it returns True.
+    """
+    board = Board.from_grid(grid)
+    if unreachable_targets(board, lazors, targets):
+        return None, 0
+    previous = ()
+    tried = 0
+    for placement in iter_placements(order_slots(grid, lazors, targets, order), blocks, start, stop):
+        remove_blocks(board, previous)
+        place_blocks(board, placement)
+        previous = placement
+        tried += 1
+        if cancel is not None and tried % 1024 == 0 and cancel():
+            break
+        if not trace_targets(board, lazors, targets):
+            return board.to_grid(), tried
+    return None, tried
+
+def solve_backtracking(grid, blocks, lazors, targets, order='row'):
+    """
+    Depth-first search that only places blocks on slots an actual beam looks
+    at. An IncrementalTracer follows each placement and removal, so only the
+    beams downstream of the changed slot are re-simulated. Once every target
+    is hit, leftover blocks go on slots no beam touches, which cannot change
+    any path.
+
+    A branch is pruned as soon as an unhit target is walled in by blocks,
+    since placed blocks are never removed further down the branch. Placements
+    already searched are remembered as bitboards, three bits of cell code
+    per cell, so each is a single int. Slots are tried in the given order
+    (see order_slots); 'beam' and 'constrained' re-sort them at every step.
+    Returns (solved grid or None, number of boards traced).
+    """
+    board = Board.from_grid(grid)
+    tracer = IncrementalTracer(board, lazors, targets)
+    slots = order_slots(grid, lazors, targets, order)
+    remaining = dict(blocks)
+    placed = {}
+    seen = set()
+    tried = 0
+
+    def search(layout):
+        nonlocal tried
+        tried += 1
+
+        left = sum(remaining.values())
+        missing = tracer.missing()
+        if not missing:
+            idle = [s for s in slots if s not in placed and not tracer.looks_at(*s)]
+            if len(idle) >= left:
+                place_blocks(board, zip(idle, ''.join(b * remaining[b] for b in 'ABC')))
+                return True
+        if left == 0 or unreachable_targets(board, lazors, missing):
+            return False
+
+        candidates = [s for s in slots if s not in placed and tracer.looks_at(*s)]
+        if order == 'beam':
+            candidates.sort(key=lambda s: tracer.first_look(*s))
+        elif order == 'constrained':
+            candidates.sort(key=lambda s: _slot_distance(s, missing))
+        for i, j in candidates:
+            for b in 'ABC':
+                if not remaining[b]:
+                    continue
+                placed[(i, j)] = b
+                key = layout | CELL_CODES[b] << 3 * (i * board.width + j)
+                if key not in seen:
+                    seen.add(key)
+                    tracer.set(i, j, b)
+                    remaining[b] -= 1
+                    if search(key):
+                        return True
+                    remaining[b] += 1
+                    tracer.undo()
+                del placed[(i, j)]
+        return False
+
+    if search(0):
+        return board.to_grid(), tried
+    return None, tried
+
+# Shared between solve_parallel and its worker processes
+_shard_state = {}
+
+def _init_shard_worker(found):
+    _shard_state['found'] = found
+
+def _solve_shard(grid, blocks, lazors, targets, shard, start, stop, order):
+    """
+    Worker entry point: brute force over one shard of slot combinations.
+    Gives up once a lower-numbered shard has reported a solution.
+    """
+    found = _shard_state['found']
+    return solve_brute_force(grid, blocks, lazors, targets, start, stop,
+                             cancel=lambda: found.value < shard, order=order)
+
+def solve_parallel(grid, blocks, lazors, targets, workers=None, shards_per_worker=8, order='row'):
+    """
+    Brute force split across a process pool. The slot combinations are cut
+    into contiguous shards, in order. Once a shard finds a solution, every
+    later shard is cancelled, and the result waits only on earlier shards.
+    The first solution in enumeration order wins, so the answer is the one
+    solve_brute_force would give.
+    Returns (solved grid or None, number of candidates traced by all workers).
+    """
+    import concurrent.futures
+    import multiprocessing
+
+    if unreachable_targets(Board.from_grid(grid), lazors, targets):
+        return None, 0
+    workers = workers or os.cpu_count()
+    total = math.comb(len(find_block_positions(grid)), sum(blocks.values()))
+    n_shards = max(1, min(total, workers * shards_per_worker))
+    bounds = [total * k // n_shards for k in range(n_shards + 1)]
+
+    found = multiprocessing.Value('i', n_shards)
+    results = {}
+    tried = 0
+    pool = concurrent.futures.ProcessPoolExecutor(
+        workers, initializer=_init_shard_worker, initargs=(found,))
+    try:
+        futures = {pool.submit(_solve_shard, grid, blocks, lazors, targets, k,
+                               bounds[k], bounds[k+1], order): k
+                   for k in range(n_shards)}
+        for future in concurrent.futures.as_completed(futures):
+            if future.cancelled():
+                continue
+            k = futures[future]
+            results[k], n = future.result()
+            tried += n
+            if results[k] is not None and k < found.value:
+                found.value = k
+                for other, j in futures.items():
+                    if j > k:
+                        other.cancel()
+            if all(j in results for j in range(min(found.value + 1, n_shards))):
+                break
+    finally:
+        pool.shutdown(cancel_futures=True)
+    return results.get(found.value), tried
+
+def solve_reduced(grid, blocks, lazors, targets):
+    """
+    Brute force over iter_reduced_placements: one candidate per class of
+    placements that are equivalent by symmetry or differ only in dead slots.
+    Returns (solved grid or None, number of candidates traced).
+    """
+    board = Board.from_grid(grid)
+    if unreachable_targets(board, lazors, targets):
+        return None, 0
+    previous = ()
+    tried = 0
+    for placement in iter_reduced_placements(grid, blocks, lazors, targets):
+        remove_blocks(board, previous)
+        place_blocks(board, placement)
+        previous = placement
+        tried += 1
+        if not trace_targets(board, lazors, targets):
+            return board.to_grid(), tried
+    return None, tried
+
+def solve_constrained(grid, blocks, lazors, targets, order='row'):
+    """
+    Brute force over iter_constrained_placements, so placements that leave a
+    target walled in are ruled out before any tracing. Slots are taken in
+    the given order (see order_slots).
+    Returns (solved grid or None, number of candidates traced).
+    """
+    board = Board.from_grid(grid)
+    previous = ()
+    tried = 0
+    for placement in iter_constrained_placements(grid, blocks, lazors, targets, order):
+        remove_blocks(board, previous)
+        place_blocks(board, placement)
+        previous = placement
+        tried += 1
+        if not trace_targets(board, lazors, targets):
+            return board.to_grid(), tried
+    return None, tried
+
+def solve_two_phase(grid, blocks, lazors, targets):
+    """
+    Searches A and C placements first, treating every B as an empty slot,
+    then fits the B blocks around each arrangement that hits all targets.
+
+    Beams never interfere, so a B can only take coverage away: any solution
+    with its B blocks lifted out still hits every target. The first phase is
+    the backtracking search without B. The second puts the B blocks on slots
+    no beam touches, or tries them on touched slots when there are too few.
+    Returns (solved grid or None, number of boards traced).
+    """
+    board = Board.from_grid(grid)
+    tracer = IncrementalTracer(board, lazors, targets)
+    slots = find_block_positions(grid)
+    remaining = {'A': blocks['A'], 'C': blocks['C']}
+    placed = {}
+    seen = set()
+    tried = 0
+
+    def arrangements(layout):
+        """
+        Yields with the tracer on each A/C arrangement that hits all targets.
+        """
+        nonlocal tried
+        tried += 1
+        missing = tracer.missing()
+        if not missing:
+            yield
+        if not any(remaining.values()) or unreachable_targets(board, lazors, missing):
+            return
+        for i, j in [s for s in slots if s not in placed and tracer.looks_at(*s)]:
+            for b in 'AC':
+                if not remaining[b]:
+                    continue
+                placed[(i, j)] = b
+                key = layout | CELL_CODES[b] << 3 * (i * board.width + j)
+                if key not in seen:
+                    seen.add(key)
+                    tracer.set(i, j, b)
+                    remaining[b] -= 1
+                    yield from arrangements(key)
+                    remaining[b] += 1
+                    tracer.undo()
+                del placed[(i, j)]
+
+    def fit_opaque():
+        """
+        Places the B blocks and the A/C blocks still left over, which must
+        go on untouched slots. Returns False if they cannot all fit.
+        """
+        nonlocal tried
+        leftover = ''.join(b * remaining[b] for b in 'AC')
+        free = [s for s in slots if s not in placed]
+        idle = [s for s in free if not tracer.looks_at(*s)]
+        if len(idle) >= blocks['B'] + len(leftover):
+            place_blocks(board, zip(idle, 'B' * blocks['B'] + leftover))
+            return True
+        # Some B has to sit in a beam, so try every choice that uses a touched slot
+        for combo in itertools.combinations(free, blocks['B']):
+            if all(s in idle for s in combo):
+                continue
+            for s in combo:
+                tracer.set(*s, 'B')
+            tried += 1
+            spare = [s for s in free if s not in combo and not tracer.looks_at(*s)]
+            if not tracer.missing() and len(spare) >= len(leftover):
+                place_blocks(board, zip(spare, leftover))
+                return True
+            for _ in combo:
+                tracer.undo()
+        return False
+
+    for _ in arrangements(0):
+        if fit_opaque():
+            return board.to_grid(), tried
+    return None, tried
+
+def solve_batched(grid, blocks, lazors, targets, batch_size=4096):
+    """
+    Brute force with NumPy: candidates are built as arrays, in the order of
+    iter_placements, and checked batch_size boards at a time with the
+    evaluator behind evaluate_batch. Peak memory is about batch_size times
+    the number of beam states, in bytes.
+    Returns (solved grid or None, number of candidates checked).
+    """
+    np = _numpy()
+    board = Board.from_grid(grid)
+    if unreachable_targets(board, lazors, targets):
+        return None, 0
+    starts = _lazor_states(board, lazors)
+    positions = [board.position(*t) for t in targets]
+    slots = find_block_positions(grid)
+    slot_cells = np.array([i * board.width + j for i, j in slots], dtype=np.int64)
+    all_blocks = ['A'] * blocks['A'] + ['B'] * blocks['B'] + ['C'] * blocks['C']
+    # Shapes are spelled out, as -1 is ambiguous when there are no blocks
+    perms = [[CELL_CODES[b] for b in perm] for perm in multiset_permutations(all_blocks)]
+    perms = np.array(perms, dtype=np.uint8).reshape(len(perms), len(all_blocks))
+    base = np.frombuffer(bytes(board.cells), dtype=np.uint8)
+
+    combos = itertools.combinations(range(len(slots)), len(all_blocks))
+    per_batch = max(1, batch_size // len(perms))
+    tried = 0
+    while True:
+        chunk = list(itertools.islice(combos, per_batch))
+        if not chunk:
+            return None, tried
+        picked = slot_cells[np.array(chunk, dtype=np.int64).reshape(len(chunk), len(all_blocks))]
+        cells = np.repeat(picked, len(perms), axis=0)
+        codes = np.tile(perms, (len(chunk), 1))
+        stacked = np.tile(base, (len(cells), 1))
+        np.put_along_axis(stacked, cells, codes, axis=1)
+        solved = np.flatnonzero(_evaluate_stacked(board, starts, positions, stacked))
+        if solved.size:
+            first = solved[0]
+            board.cells[:] = stacked[first].tobytes()
+            return board.to_grid(), tried + int(first) + 1
+        tried += len(stacked)
+
+def solve_dpll(grid, blocks, lazors, targets):
+    """
+    Exact DPLL search over placement variables, with clauses learnt from
+    traces. Every slot is a variable over 'o' (empty), 'A', 'B' and 'C';
+    undecided slots are traced as empty.
+
+    The search always decides the undecided slot the beams look at first.
+    Once no beam looks at an undecided slot the trace depends on decided
+    slots only, so if it misses a target, the values of the slots it looked
+    at form a nogood clause: no completion can work. A target walled in by
+    decided blocks gives a nogood over its flanking slots. Clauses are unit
+    propagated as slots are decided, and the block counts are propagated as
+    cardinality constraints, so a learnt clause prunes every later branch
+    that repeats it without tracing.
+    Returns (solved grid or None, number of boards traced).
+    """
+    board = Board.from_grid(grid)
+    if unreachable_targets(board, lazors, targets):
+        return None, 0
+    tracer = IncrementalTracer(board, lazors, targets)
+    slots = find_block_positions(grid)
+    domains = {s: set('oABC') for s in slots}
+    value = {}
+    remaining = dict(blocks)
+    # Clauses are nogoods, lists of (slot, value) that must not all hold.
+    # Each is watched through its first two literals, keyed by (slot, value)
+    watches = collections.defaultdict(list)
+    # Each entry undoes one assignment (slot, None) or domain removal (slot, value)
+    trail = []
+    decided_at = {}
+    tried = 0
+
+    def assign(s, v):
+        value[s] = v
+        decided_at[s] = len(trail)
+        if v != 'o':
+            remaining[v] -= 1
+        tracer.set(*s, v)
+        trail.append((s, None))
+
+    def remove(s, v):
+        domains[s].discard(v)
+        trail.append((s, v))
+
+    def backtrack(mark):
+        while len(trail) > mark:
+            s, v = trail.pop()
+            if v is None:
+                v = value.pop(s)
+                if v != 'o':
+                    remaining[v] += 1
+                tracer.undo()
+            else:
+                domains[s].add(v)
+
+    def learn(nogood):
+        # Watch the latest decisions, which are the first to be taken back
+        nogood.sort(key=lambda literal: -decided_at[literal[0]])
+        for literal in nogood[:2]:
+            watches[literal].append(nogood)
+
+    def holds(literal):
+        return value.get(literal[0], literal[1]) == literal[1] and (
+            literal[0] in value or literal[1] in domains[literal[0]])
+
+    def wake(literal):
+        """
+        Visits the clauses watching a literal that has just become true.
+        Returns False on a conflict.
+        """
+        watching = watches[literal]
+        keep = []
+        for i, nogood in enumerate(watching):
+            if len(nogood) == 1:
+                keep.extend(watching[i:])
+                watches[literal] = keep
+                return False
+            if nogood[0] == literal:
+                nogood[0], nogood[1] = nogood[1], nogood[0]
+            other = nogood[0]
+            if not holds(other):
+                keep.append(nogood)
+                continue
+            for k in range(2, len(nogood)):
+                if value.get(nogood[k][0]) != nogood[k][1]:
+                    nogood[1], nogood[k] = nogood[k], nogood[1]
+                    watches[nogood[1]].append(nogood)
+                    break
+            else:
+                keep.append(nogood)
+                if other[0] in value:
+                    keep.extend(watching[i + 1:])
+                    watches[literal] = keep
+                    return False
+                remove(*other)
+        watches[literal] = keep
+        return True
+
+    def propagate(changed):
+        """
+        Applies the clauses on newly decided slots and the block counts until
+        nothing more follows. Returns False on a conflict.
+        """
+        queue = list(changed)
+        while True:
+            while queue:
+                s = queue.pop()
+                if not wake((s, value[s])):
+                    return False
+
+            undecided = [s for s in slots if s not in value]
+            for b in 'ABC':
+                holders = [s for s in undecided if b in domains[s]]
+                if len(holders) < remaining[b]:
+                    return False
+                if not remaining[b]:
+                    for s in holders:
+                        remove(s, b)
+            for s in undecided:
+                if not domains[s]:
+                    return False
+                if len(domains[s]) == 1:
+                    assign(s, next(iter(domains[s])))
+                    queue.append(s)
+            if not queue:
+                return sum(remaining.values()) <= sum(1 for s in undecided if domains[s] != {'o'})
+
+    def search():
+        nonlocal tried
+        tried += 1
+        missing = tracer.missing()
+        left = sum(remaining.values())
+        if not missing:
+            idle = [s for s in slots if s not in value and not tracer.looks_at(*s)]
+            if len(idle) >= left:
+                place_blocks(board, zip(idle, ''.join(b * remaining[b] for b in 'ABC')))
+                return True
+        looked = [s for s in slots if s not in value and tracer.looks_at(*s)]
+        if not looked:
+            if missing:
+                learn([(s, value[s]) for s in slots if s in value and tracer.looks_at(*s)])
+            return False
+        walled = unreachable_targets(board, lazors, missing)
+        if walled:
+            for t in walled:
+                learn([(s, value[s]) for s in flanking_cells(t) if s in value])
+            return False
+
+        s = min(looked, key=lambda s: tracer.first_look(*s))
+        for v in 'ACBo':
+            if v not in domains[s]:
+                continue
+            mark = len(trail)
+            assign(s, v)
+            if propagate([s]) and search():
+                return True
+            backtrack(mark)
+        return False
+
+    if propagate([]) and search():
+        return board.to_grid(), tried
+    return None, tried
+
+# Solvers that accept order= (see order_slots)
+ORDERED_SOLVERS = {'brute', 'backtrack', 'constrained'}
+
+SOLVERS = {
+    'brute': solve_brute_force,
+    'backtrack': solve_backtracking,
+    'reduced': solve_reduced,
+    'two_phase': solve_two_phase,
+    'batch': solve_batched,
+    'constrained': solve_constrained,
+    'dpll': solve_dpll,
+}
+
+# =====================
+# STEP 8: Main Entrypoint
+# =====================
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'lazors')
+DEFAULT_STORE = os.path.join(DEFAULT_CACHE_DIR, 'solutions.sqlite3')
+
+def _run_solver(method, grid, blocks, lazors, targets, order='row'):
+    """
+    Calls SOLVERS[method], passing order on to the solvers that take one.
+    """
+    if order == 'row':
+        return SOLVERS[method](grid, blocks, lazors, targets)
+    if method not in ORDERED_SOLVERS:
+        raise ValueError(f"order is only supported with method in {sorted(ORDERED_SOLVERS)}")
+    return SOLVERS[method](grid, blocks, lazors, targets, order=order)
+
+def level_fingerprint(grid, blocks, lazors, targets):
+    """
+    Returns (fingerprint, transform) for a level. The fingerprint is a hex
+    digest of the level with its lazors and targets sorted, taken in
+    whichever of TRANSFORMS gives the smallest description, so a level and
+    its mirror images share one fingerprint. transform maps the level into
+    that canonical frame. Transposes follow the rules of board_symmetries.
+    """
+    import hashlib
+    import json
+
+    h, w = len(grid), len(grid[0])
+    diagonal = all(dx and dy and (x + y) % 2 for (x, y), (dx, dy) in lazors)
+    best = None
+    for t in TRANSFORMS:
+        if t[0] and (w != h or not diagonal):
+            continue
+        cells = [[None] * w for _ in range(h)]
+        for y in range(h):
+            for x in range(w):
+                tx, ty = transform_point(t, w, h, (x, y))
+                cells[ty][tx] = grid[y][x]
+        key = ('/'.join(''.join(row) for row in cells),
+               [blocks.get(b, 0) for b in 'ABC'],
+               sorted([*transform_point(t, w, h, pos), *transform_direction(t, d)] for pos, d in lazors),
+               sorted(list(transform_point(t, w, h, p)) for p in targets))
+        if best is None or key < best[0]:
+            best = key, t
+    key, transform = best
+    return hashlib.sha256(json.dumps(key).encode()).hexdigest(), transform
+
+class SolutionStore:
+    """
+    A SQLite file of solved levels, keyed by level_fingerprint and holding
+    the block placements in the canonical frame. Every hit is checked with
+    one trace before it is returned, so a stale or damaged entry can cost a
+    search but never a wrong answer. Beyond max_entries, the least recently
+    used entries are evicted. Several processes may share one file.
+    """
+    def __init__(self, path, max_entries=10000):
+        import sqlite3
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path, timeout=30)
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS solutions ("
+                             "fingerprint TEXT PRIMARY KEY, placements TEXT NOT NULL, used INTEGER NOT NULL)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    def get(self, grid, blocks, lazors, targets):
+        """
+        Returns the stored solution for the level as a new grid, or None if
+        there is none or it no longer solves the level (it is then dropped).
+        """
+        import json
+        fingerprint, transform = level_fingerprint(grid, blocks, lazors, targets)
+        row = self._db.execute("SELECT placements FROM solutions WHERE fingerprint = ?",
+                               (fingerprint,)).fetchone()
+        if row is None:
+            return None
+        h, w = len(grid), len(grid[0])
+        transpose, flip_x, flip_y = transform
+        solved = [r[:] for r in grid]
+        counts = collections.Counter()
+        try:
+            for x, y, block in json.loads(row[0]):
+                # Undo transform_point: flips first, then the transpose
+                x, y = (w - 1 - x if flip_x else x), (h - 1 - y if flip_y else y)
+                if transpose:
+                    x, y = y, x
+                if not (0 <= x < w and 0 <= y < h) or solved[y][x] != 'o' or block not in 'ABC':
+                    raise ValueError(f"bad placement {block} at {(x, y)}")
+                solved[y][x] = block
+                counts[block] += 1
+            valid = all(counts[b] == blocks.get(b, 0) for b in 'ABC') and not trace_targets(solved, lazors, targets)
+        except (ValueError, TypeError):
+            valid = False
+        with self._db:
+            if valid:
+                self._db.execute("UPDATE solutions SET used = ? WHERE fingerprint = ?",
+                                 (time.time_ns(), fingerprint))
+            else:
+                self._db.execute("DELETE FROM solutions WHERE fingerprint = ?", (fingerprint,))
+        return solved if valid else None
+
+    def put(self, grid, blocks, lazors, targets, solved):
+        """
+        Records solved as the solution of the level given by grid, blocks,
+        lazors and targets, then evicts down to max_entries.
+        """
+        import json
+        fingerprint, transform = level_fingerprint(grid, blocks, lazors, targets)
+        h, w = len(grid), len(grid[0])
+        placements = [[*transform_point(transform, w, h, (x, y)), solved[y][x]]
+                      for y in range(h) for x in range(w)
+                      if grid[y][x] == 'o' and solved[y][x] != 'o']
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)",
+                             (fingerprint, json.dumps(placements), time.time_ns()))
+            self._db.execute("DELETE FROM solutions WHERE fingerprint IN (SELECT fingerprint FROM solutions "
+                             "ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+# Stores that failed to open or update in this process, which are not retried
+_broken_stores = set()
+
+def _store_failed(store, err):
+    """
+    Warns once on stderr that the store at path store is unusable, and
+    stops using it for the rest of the process.
+    """
+    if store not in _broken_stores:
+        _broken_stores.add(store)
+        print(f"warning: solution store {store} is unusable ({err}); solving without it", file=sys.stderr)
+
+def _usable_store(store):
+    """
+    Returns store if a SolutionStore can be opened there, else warns and
+    returns None. Lets a batch run check the store once, up front.
+    """
+    import sqlite3
+    try:
+        SolutionStore(store).close()
+    except (OSError, sqlite3.Error) as err:
+        _store_failed(store, err)
+        return None
+    return store
+
+def _solve_stored(store, method, grid, blocks, lazors, targets, order='row', workers=1):
+    """
+    Solves a level, looking in the SolutionStore at path store first (when
+    given) and recording any new solution there. A store that cannot be
+    opened or written is skipped with a warning, never failing the level.
+    Returns (solved, candidates, hit); a hit costs no candidates.
+    """
+    if store in _broken_stores:
+        store = None
+    if store is not None:
+        import sqlite3
+        try:
+            with SolutionStore(store) as solutions:
+                solved = solutions.get(grid, blocks, lazors, targets)
+        except (OSError, sqlite3.Error) as err:
+            _store_failed(store, err)
+            store, solved = None, None
+        if solved is not None:
+            return solved, 0, True
+    if workers != 1:
+        if method != 'brute':
+            raise ValueError("workers is only supported with method='brute'")
+        solved, tried = solve_parallel(grid, blocks, lazors, targets, workers, order=order)
+    else:
+        solved, tried = _run_solver(method, grid, blocks, lazors, targets, order)
+    if store is not None and solved is not None:
+        try:
+            with SolutionStore(store) as solutions:
+                solutions.put(grid, blocks, lazors, targets, solved)
+        except (OSError, sqlite3.Error) as err:
+            _store_failed(store, err)
+    return solved, tried, False
+
+class Solution:
+    """
+    The outcome of solve_lazor. grid is the solved grid, or None if the
+    level has no solution; placements lists the ((row, col), block) pairs
+    that were filled in, and paths the points visited by each lazor.
+    candidates counts the boards traced and seconds the wall time, parsing
+    included; stored says whether the answer came from a SolutionStore.
+    Nothing is drawn until render is called.
+    """
+    def __init__(self, file_path, grid, lazors, targets, solved, candidates, seconds, stored=False):
+        self.file_path = file_path
+        self.level = os.path.splitext(os.path.basename(file_path))[0]
+        self.grid = solved
+        self.lazors = lazors
+        self.targets = targets
+        self.candidates = candidates
+        self.seconds = seconds
+        self.stored = stored
+        if solved is None:
+            self.placements, self.paths = [], []
+        else:
+            self.placements = [((i, j), solved[i][j]) for i, j in find_block_positions(grid)
+                               if solved[i][j] != 'o']
+            self.paths = [trace(solved, pos, direction) for pos, direction in lazors]
+
+    @property
+    def solved(self):
+        return self.grid is not None
+
+    def summary(self):
+        """
+        Returns the JSON-ready dict reported by solve_level.
+        """
+        return {
+            'level': self.level,
+            'solved': self.solved,
+            'candidates': self.candidates,
+            'seconds': round(self.seconds, 6),
+        }
+
+    def render(self, filename=None):
+        """
+        Draws the solved grid with draw_solution, by default next to the
+        .bff file as <name>_solution.png, and returns the filename.
+        """
+        if not self.solved:
+            raise ValueError(f"{self.level} has no solution to render")
+        filename = filename or self.file_path.replace('.bff', '_solution.png')
+        draw_solution(self.grid, self.lazors, self.paths, self.targets, filename)
+        return filename
+
+def solve_lazor(file_path, method='backtrack', workers=1, order='row', store=None):
+    """
+    Main function to solve the Lazor puzzle.
+    It parses the BFF file, searches block arrangements with the chosen
+    method ('backtrack' or 'brute'), simulates lazor paths, and returns a
+    Solution; call its render method for an image. With workers > 1 the
+    brute-force search is spread over that many processes. order picks the
+    slot-ordering heuristic (see order_slots) and store the path of a
+    SolutionStore to reuse and record solutions in.
+    """
+    start = time.perf_counter()
+    grid, blocks, lazors, targets = parse_bff(file_path)
+    solved, tried, hit = _solve_stored(store, method, grid, blocks, lazors, targets, order, workers)
+    return Solution(file_path, grid, lazors, targets, solved, tried, time.perf_counter() - start, hit)
+
+def solve_level(file_path, method='backtrack', order='row', store=None):
+    """
+    Solves one .bff file without drawing anything and summarizes the run
+    as a JSON-ready dict: level name, whether it was solved, how many
+    candidates were traced and the wall time in seconds. With a store, the
+    dict also says whether the solution came from it.
+    """
+    solution = solve_lazor(file_path, method, order=order, store=store)
+    result = solution.summary()
+    if store is not None:
+        result['stored'] = solution.stored
+    return result
+
+def solve_directory(path, jobs=None, method='backtrack', out=None, order='row', store=None):
+    """
+    Solves every .bff file in a directory (or a single file) on a process
+    pool of jobs workers. Each level's summary is written to out as one JSON
+    line as soon as it finishes. A level that fails to parse or solve gets
+    an 'error' entry instead.
+    Returns True if every level was solved.
+    """
+    import json
+    out = out or sys.stdout
+    if store is not None:
+        store = _usable_store(store)
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.bff'))
+    else:
+        files = [path]
+
+    def report(file_path, result):
+        nonlocal all_solved
+        if isinstance(result, Exception):
+            result = {'level': os.path.splitext(os.path.basename(file_path))[0],
+                      'solved': False, 'error': f"{type(result).__name__}: {result}"}
+        all_solved = all_solved and result['solved']
+        out.write(json.dumps(result) + '\n')
+        out.flush()
+
+    all_solved = True
+    if jobs == 1:
+        for file_path in files:
+            try:
+                result = solve_level(file_path, method, order, store)
+            except Exception as err:
+                result = err
+            report(file_path, result)
+        return all_solved
+
+    import concurrent.futures
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        futures = {pool.submit(solve_level, f, method, order, store): f for f in files}
+        for future in concurrent.futures.as_completed(futures):
+            report(futures[future], future.exception() or future.result())
+    return all_solved
+
+def main(argv=None):
+    """
+    Command line entry point. With no arguments it asks for a single .bff
+    file and solves it interactively; 'solve PATH' batch-solves a directory.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m lazors', description='Solve Lazor puzzles.')
+    commands = parser.add_subparsers(dest='command')
+    solve = commands.add_parser('solve', help='solve every .bff level in a directory, as JSON lines')
+    solve.add_argument('path', help='a directory of .bff files, or a single .bff file')
+    solve.add_argument('--jobs', type=int, default=None,
+                       help='number of worker processes (default: one per CPU)')
+    solve.add_argument('--method', choices=sorted(SOLVERS), default='backtrack',
+                       help='search strategy (default: backtrack)')
+    solve.add_argument('--order', choices=sorted(SLOT_ORDERS), default='row',
+                       help='slot-ordering heuristic for brute, backtrack and constrained (default: row)')
+    solve.add_argument('--store', default=DEFAULT_STORE,
+                       help=f'SQLite file of known solutions to reuse and extend (default: {DEFAULT_STORE})')
+    solve.add_argument('--no-store', dest='store', action='store_const', const=None,
+                       help='always search, and do not record solutions')
+    args = parser.parse_args(argv)
+
+    if args.command == 'solve':
+        return 0 if solve_directory(args.path, args.jobs, args.method, order=args.order,
+                                    store=args.store) else 1
+    path = input("Please enter the .bff filename (with extension): ").strip()
+    solution = solve_lazor(path, store=DEFAULT_STORE)
+    if not solution.solved:
+        print("❌ No valid solution found.")
+        return 1
+    solution.render()
+    return 0
+
+# Run script from command line
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,31 @@
 
 import unittest
+import importlib.util
+import io
+import json
 import os
+import pickle
+import random
+import shutil
+import subprocess
+import sys
 import tempfile
-from lazors import parse_bff, reflect_or_refract, trace, find_block_positions, generate_block_grids
+import unittest.mock
+from benchmark import RayTable
+from lazors import parse_bff, reflect_or_refract, trace, find_block_positions, generate_block_grids, \
+    all_points_hit, multiset_permutations, count_placements, iter_placements, \
+    solve_brute_force, solve_backtracking, Board, get_block_at, CELL_CODES, CELL_TYPES, \
+    DIRECTIONS, TRANSITIONS, transition_key, trace_all, trace_targets, unreachable_targets, \
+    solve_parallel, solve_directory, solve_level, board_symmetries, slot_classes, \
+    iter_reduced_placements, reduction_report, solve_reduced, reachable_cells, \
+    count_live_placements, IncrementalTracer, solve_two_phase, evaluate_batch, \
+    solve_batched, place_blocks, trace_bits, generate_block_masks, place_masks, slot_domains, \
+    iter_constrained_placements, solve_constrained, solve_dpll, order_slots, SLOT_ORDERS, main, \
+    BffError, SolutionStore, level_fingerprint, transform_point, \
+    transform_direction, Solution, solve_lazor
+
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels')
+HAVE_NUMPY = importlib.util.find_spec('numpy') is not None
 
 class TestLazorFunctions(unittest.TestCase):
     def setUp(self):
@@ -94,5 +117,564 @@ class TestLazorFunctions(unittest.TestCase):
         self.assertTrue(all_points_hit(paths, [(0, 3), (6, 1)]))
         self.assertFalse(all_points_hit(paths, [(0, 3), (5, 5)]))
 
+    # ------------------------------
+    # Test 6: Placement Enumerator
+    # ------------------------------
+    def test_multiset_permutations(self):
+        """Each distinct ordering is produced exactly once"""
+        perms = list(multiset_permutations(['B', 'A', 'A', 'C']))
+        self.assertEqual(len(perms), 12)
+        self.assertEqual(len(set(perms)), 12)
+        self.assertEqual(perms[0], ('A', 'A', 'B', 'C'))
+
+    def test_iter_placements(self):
+        """Placements are distinct and match the closed-form count"""
+        grid, _, _, _ = parse_bff(self.temp_bff.name)
+        slots = find_block_positions(grid)
+        blocks = {'A': 2, 'B': 1, 'C': 1}
+        placements = list(iter_placements(slots, blocks))
+        self.assertEqual(len(placements), count_placements(len(slots), blocks))
+        self.assertEqual(len(set(placements)), len(placements))
+
+    def test_generate_block_grids_inplace(self):
+        """In-place mode reuses one board and matches the copying mode"""
+        grid, blocks, _, _ = parse_bff(self.temp_bff.name)
+        original = [row[:] for row in grid]
+        copies = list(generate_block_grids(grid, blocks))
+        boards = set()
+        for expected, board in zip(copies, generate_block_grids(grid, blocks, inplace=True)):
+            self.assertEqual(board, expected)
+            boards.add(id(board))
+        self.assertEqual(len(boards), 1)
+        self.assertEqual(grid, original)
+
+    # ------------------------------
+    # Test 7: Search Strategies
+    # ------------------------------
+    def test_solve_backtracking(self):
+        """Backtracking finds a board that places every block and hits every target"""
+        grid, blocks, lazors, targets = parse_bff(self.temp_bff.name)
+        solved, _ = solve_backtracking(grid, blocks, lazors, targets)
+        self.assertEqual(sum(row.count('B') for row in solved), 3)
+        paths = [trace(solved, pos, direction) for pos, direction in lazors]
+        self.assertTrue(all_points_hit(paths, targets))
+
+    def test_solve_backtracking_unsolvable(self):
+        """Backtracking agrees with brute force when no placement works"""
+        grid, blocks, lazors, _ = parse_bff(self.temp_bff.name)
+        targets = [(6, 3), (0, 3), (3, 6)]
+        self.assertIsNone(solve_brute_force(grid, blocks, lazors, targets)[0])
+        self.assertIsNone(solve_backtracking(grid, blocks, lazors, targets)[0])
+
+    # ------------------------------
+    # Test 8: Flat Board
+    # ------------------------------
+    def test_board_round_trip(self):
+        """A Board converts back to the grid it was built from"""
+        grid, _, _, _ = parse_bff(self.temp_bff.name)
+        board = Board.from_grid(grid)
+        self.assertEqual(board.to_grid(), grid)
+        self.assertEqual(get_block_at(board, 2, 3, 1, 1), CELL_CODES[get_block_at(grid, 2, 3, 1, 1)])
+
+    def test_trace_board_matches_grid(self):
+        """Tracing a Board gives the same path as tracing the grid"""
+        grid, _, lazors, _ = parse_bff(self.temp_bff.name)
+        grid[3][3] = 'C'
+        grid[5][1] = 'A'
+        board = Board.from_grid(grid)
+        for pos, direction in lazors:
+            self.assertEqual(trace(board, pos, direction), trace(grid, pos, direction))
+
+    # ------------------------------
+    # Test 9: Transition Table
+    # ------------------------------
+    def test_transition_table(self):
+        """The table agrees with reflect_or_refract for every combination"""
+        for code, block in enumerate(CELL_TYPES):
+            for x in (2, 3):
+                for d, direction in enumerate(DIRECTIONS):
+                    expected = reflect_or_refract((x, 1), direction, block)
+                    got = [DIRECTIONS[i] for i in TRANSITIONS[transition_key(code, x % 2, d)]]
+                    self.assertEqual(got, expected)
+
+    # ------------------------------
+    # Test 10: Multi-Beam Tracer
+    # ------------------------------
+    def test_trace_all(self):
+        """One shared pass hits the same points as tracing each lazor"""
+        grid, _, lazors, _ = parse_bff(self.temp_bff.name)
+        grid[3][3] = 'C'
+        grid[1][5] = 'A'
+        hits = trace_all(grid, lazors)
+        expected = {p for pos, direction in lazors for p in trace(grid, pos, direction)}
+        self.assertEqual(hits, expected)
+        self.assertTrue(all_points_hit(hits, list(expected)))
+        self.assertFalse(all_points_hit(hits, [(5, 5)]))
+
+    # ------------------------------
+    # Test 11: Early-Exit Tracing
+    # ------------------------------
+    def test_trace_targets(self):
+        """Reports the missed targets, or none once every target is covered"""
+        grid, _, lazors, _ = parse_bff(self.temp_bff.name)
+        hits = sorted(trace_all(grid, lazors))
+        self.assertEqual(trace_targets(grid, lazors, hits), [])
+        self.assertEqual(trace_targets(grid, lazors, [hits[0], (0, 5)]), [(0, 5)])
+
+    def test_unreachable_targets(self):
+        """Off-board, wrong-parity and walled-in targets are reported without tracing"""
+        grid, _, lazors, _ = parse_bff(self.temp_bff.name)
+        grid[3][1] = 'B'
+        board = Board.from_grid(grid)
+        targets = [(0, 3), (9, 9), (2, 2), (2, 3)]
+        self.assertEqual(unreachable_targets(board, lazors, targets), [(0, 3), (9, 9), (2, 2)])
+        self.assertEqual(trace_targets(board, lazors, [(2, 3), (0, 3)]), [(0, 3)])
+
+    # ------------------------------
+    # Test 12: Parallel Brute Force
+    # ------------------------------
+    def test_solve_parallel_matches_serial(self):
+        """Sharded search returns exactly the serial brute-force solution"""
+        grid, blocks, lazors, targets = parse_bff(self.temp_bff.name)
+        serial, _ = solve_brute_force(grid, blocks, lazors, targets)
+        parallel, _ = solve_parallel(grid, blocks, lazors, targets, workers=2, shards_per_worker=4)
+        self.assertEqual(parallel, serial)
+
+    # ------------------------------
+    # Test 13: Batch Solving
+    # ------------------------------
+    def test_solve_directory(self):
+        """Each level is reported as one JSON line"""
+        out = io.StringIO()
+        self.assertTrue(solve_directory(self.temp_bff.name, jobs=1, out=out))
+        result = json.loads(out.getvalue())
+        self.assertEqual(result['level'], os.path.basename(self.temp_bff.name)[:-4])
+        self.assertTrue(result['solved'])
+        self.assertGreater(result['candidates'], 0)
+
+    def test_reference_levels(self):
+        """Every shipped reference level is solvable"""
+        for name in sorted(os.listdir(LEVELS_DIR)):
+            with self.subTest(level=name):
+                self.assertTrue(solve_level(os.path.join(LEVELS_DIR, name))['solved'])
+
+    # ------------------------------
+    # Test 14: Symmetry Reduction
+    # ------------------------------
+    def test_symmetry_reduction(self):
+        """Mirror-image placements are enumerated once, and the report counts them exactly"""
+        grid = [['x'] * 7 for _ in range(7)]
+        for i in (1, 3, 5):
+            for j in (1, 3, 5):
+                grid[i][j] = 'o'
+        lazors = [((0, 3), (1, 1)), ((6, 3), (-1, 1))]
+        blocks = {'A': 2, 'B': 1, 'C': 0}
+        self.assertEqual(len(board_symmetries(grid, lazors, [(3, 6)])), 2)
+        self.assertEqual(len(board_symmetries(grid, lazors, [(1, 6)])), 1)
+        placements = list(iter_reduced_placements(grid, blocks, lazors, [(3, 6)]))
+        report = reduction_report(grid, blocks, lazors, [(3, 6)])
+        self.assertEqual(report['reduced'], len(placements))
+        self.assertLess(report['reduced'], report['placements'])
+
+    def test_dead_slots(self):
+        """Slots no beam can ever reach form their own class"""
+        grid, blocks, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'tiny_5.bff'))
+        dead, orbits, _ = slot_classes(grid, lazors, targets)
+        self.assertEqual(dead, [(1, 5), (5, 5)])
+        self.assertEqual(len(orbits), 6)
+        self.assertIsNotNone(solve_reduced(grid, blocks, lazors, targets)[0])
+
+    # ------------------------------
+    # Test 15: Reachability Filter
+    # ------------------------------
+    def test_reachable_cells_uses_block_counts(self):
+        """Without A or C blocks beams cannot turn, so far fewer slots are live"""
+        grid, _, _, _ = parse_bff(self.temp_bff.name)
+        lazors = [((3, 6), (-1, -1))]
+        slots = set(find_block_positions(grid))
+        self.assertEqual(reachable_cells(grid, lazors, {'A': 0, 'B': 3, 'C': 0}) & slots,
+                         {(3, 1), (5, 1), (5, 3)})
+        self.assertEqual(reachable_cells(grid, lazors, {'A': 1, 'B': 2, 'C': 0}) & slots, slots)
+
+    def test_generate_block_grids_dumps_dead_slots(self):
+        """Unreachable slots are filled once instead of being enumerated"""
+        grid, _, _, _ = parse_bff(self.temp_bff.name)
+        blocks = {'A': 0, 'B': 3, 'C': 0}
+        lazors = [((3, 0), (-1, 1))]
+        boards = list(generate_block_grids(grid, blocks, lazors=lazors))
+        self.assertEqual(len(boards), count_live_placements(grid, blocks, lazors))
+        self.assertLess(len(boards), len(list(generate_block_grids(grid, blocks))))
+        self.assertTrue(all(sum(row.count('B') for row in g) == 3 for g in boards))
+
+    # ------------------------------
+    # Test 16: Incremental Tracer
+    # ------------------------------
+    def test_incremental_tracer_matches_full_trace(self):
+        """Every set and undo leaves the same beams as tracing from scratch"""
+        grid, _, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'mad_7.bff'))
+        board = Board.from_grid(grid)
+        tracer = IncrementalTracer(board, lazors, targets)
+        slots = find_block_positions(grid)
+        rng = random.Random(0)
+        for _ in range(200):
+            if tracer._undo and rng.random() < 0.3:
+                tracer.undo()
+            else:
+                tracer.set(*rng.choice(slots), rng.choice('oABC'))
+            touched = set()
+            hits = trace_all(board.copy(), lazors, touched)
+            self.assertEqual(tracer.hits(), hits)
+            self.assertEqual(tracer.touched(), touched)
+            self.assertEqual(tracer.missing(), [t for t in targets if t not in hits])
+
+    def test_incremental_tracer_undo_restores_board(self):
+        """Undoing every change puts back the original board and beams"""
+        grid, _, lazors, targets = parse_bff(self.temp_bff.name)
+        board = Board.from_grid(grid)
+        tracer = IncrementalTracer(board, lazors, targets)
+        hits = tracer.hits()
+        for (i, j), b in zip(find_block_positions(grid), 'BAC'):
+            tracer.set(i, j, b)
+        for _ in range(3):
+            tracer.undo()
+        self.assertEqual(board.to_grid(), grid)
+        self.assertEqual(tracer.hits(), hits)
+
+    # ------------------------------
+    # Test 17: Two-Phase Solving
+    # ------------------------------
+    def test_solve_two_phase(self):
+        """B blocks are fitted after the search, which then never branches on them"""
+        grid, blocks, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'showstopper_4.bff'))
+        solved, tried = solve_two_phase(grid, blocks, lazors, targets)
+        self.assertEqual(sum(row.count('B') for row in solved) - sum(row.count('B') for row in grid), 3)
+        paths = [trace(solved, pos, direction) for pos, direction in lazors]
+        self.assertTrue(all_points_hit(paths, targets))
+        self.assertLess(tried, solve_backtracking(grid, blocks, lazors, targets)[1])
+
+    def test_solve_two_phase_unsolvable(self):
+        """Two-phase solving proves the B blocks cannot fit"""
+        grid, blocks, lazors, _ = parse_bff(self.temp_bff.name)
+        self.assertIsNone(solve_two_phase(grid, blocks, lazors, [(6, 3), (0, 3), (3, 6)])[0])
+
+    # ------------------------------
+    # Test 18: Ray-Jump Tables
+    # ------------------------------
+    def test_ray_table_matches_trace_all(self):
+        """Jumping between blocks hits and looks at the same cells as stepping"""
+        grid, _, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'yarn_5.bff'))
+        board = Board.from_grid(grid)
+        rays = RayTable(board)
+        slots = find_block_positions(grid)
+        rng = random.Random(1)
+        for _ in range(50):
+            rays.set(*rng.choice(slots), rng.choice('oABC'))
+            touched = set()
+            hits = trace_all(board, lazors, touched)
+            points, looks = rays.trace(lazors)
+            self.assertEqual(points, rays.mask(hits))
+            self.assertEqual({divmod(q, board.width) for q in range(len(board.cells) - 1)
+                              if looks >> q & 1}, touched)
+        fresh = RayTable(board.copy())
+        self.assertEqual((fresh.stop, fresh.points, fresh.looks), (rays.stop, rays.points, rays.looks))
+
+    def test_ray_table_stops_at_targets(self):
+        """With a target mask the trace returns once every target is hit"""
+        grid, _, lazors, targets = parse_bff(self.temp_bff.name)
+        rays = RayTable(Board.from_grid(grid))
+        mask = rays.mask(targets)
+        self.assertEqual(rays.trace(lazors, mask)[0] & mask, mask)
+
+    # ------------------------------
+    # Test 19: NumPy Batch Evaluation
+    # ------------------------------
+    @unittest.skipUnless(HAVE_NUMPY, 'needs NumPy')
+    def test_evaluate_batch(self):
+        """The batch verdicts agree with tracing each board on its own"""
+        grid, blocks, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'numbered_6.bff'))
+        placements = list(iter_placements(find_block_positions(grid), blocks))[:3000]
+        expected = []
+        for placement in placements:
+            board = Board.from_grid(grid)
+            place_blocks(board, placement)
+            expected.append(not trace_targets(board, lazors, targets))
+        self.assertEqual(list(evaluate_batch(grid, lazors, targets, placements)), expected)
+        self.assertEqual(len(evaluate_batch(grid, lazors, targets, [])), 0)
+
+    @unittest.skipUnless(HAVE_NUMPY, 'needs NumPy')
+    def test_solve_batched(self):
+        """Batches of any size find the same first solution as brute force"""
+        grid, blocks, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'mad_1.bff'))
+        expected = solve_brute_force(grid, blocks, lazors, targets)
+        for batch_size in (1, 100, 4096):
+            self.assertEqual(solve_batched(grid, blocks, lazors, targets, batch_size), expected)
+        grid, blocks, lazors, _ = parse_bff(self.temp_bff.name)
+        self.assertIsNone(solve_batched(grid, blocks, lazors, [(6, 3), (0, 3), (3, 6)])[0])
+
+        # Levels with no movable blocks have the one empty placement to check
+        grid = [['o'] * 7 for _ in range(7)]
+        no_blocks = {'A': 0, 'B': 0, 'C': 0}
+        for targets in ([(1, 2), (3, 4)], [(1, 2), (4, 3)]):
+            with self.subTest(targets=targets):
+                self.assertEqual(solve_batched(grid, no_blocks, [((0, 1), (1, 1))], targets),
+                                 solve_brute_force(grid, no_blocks, [((0, 1), (1, 1))], targets))
+
+    # ------------------------------
+    # Test 20: Bitboards
+    # ------------------------------
+    def test_trace_bits(self):
+        """The hit bitboard has exactly the points trace_all returns"""
+        grid, _, lazors, targets = parse_bff(self.temp_bff.name)
+        board = Board.from_grid(grid)
+        hits = trace_bits(board, lazors)
+        self.assertEqual(hits, board.mask(trace_all(board, lazors)))
+        self.assertTrue(all_points_hit(hits, board.mask(targets)))
+        self.assertFalse(all_points_hit(hits, board.mask([(6, 3)])))
+
+    def test_generate_block_masks(self):
+        """Block bitboards describe the same boards as generate_block_grids"""
+        grid, blocks, _, _ = parse_bff(os.path.join(LEVELS_DIR, 'mad_1.bff'))
+        for masks, expected in zip(generate_block_masks(grid, blocks), generate_block_grids(grid, blocks)):
+            board = Board.from_grid(grid)
+            place_masks(board, masks)
+            self.assertEqual(board.to_grid(), expected)
+            self.assertEqual(board.block_masks(), masks)
+
+    # ------------------------------
+    # Test 21: Constraint Propagation
+    # ------------------------------
+    def test_slot_domains(self):
+        """A target's only crossable flank is forced empty when there is no C"""
+        grid, blocks, lazors, targets = parse_bff(self.temp_bff.name)
+        domains, pairs = slot_domains(grid, lazors, targets, blocks)
+        self.assertEqual(domains[(3, 1)], '')
+        self.assertEqual(sum(d == 'ABC' for d in domains.values()), 6)
+        self.assertEqual(pairs, [])
+        grid, blocks, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'tiny_5.bff'))
+        domains, pairs = slot_domains(grid, lazors, targets, blocks)
+        self.assertEqual(domains[(3, 5)], 'C')
+        self.assertEqual(pairs, [((1, 1), (3, 1))])
+        self.assertIsNone(slot_domains(grid, lazors, [(20, 20)], blocks))
+
+    def test_constrained_placements_keep_every_solution(self):
+        """Only placements that cannot solve the level are left out"""
+        grid, blocks, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'numbered_6.bff'))
+        constrained = {tuple(sorted(p)) for p in iter_constrained_placements(grid, blocks, lazors, targets)}
+        self.assertLess(len(constrained), count_placements(len(find_block_positions(grid)), blocks))
+        for placement in iter_placements(find_block_positions(grid), blocks):
+            board = Board.from_grid(grid)
+            place_blocks(board, placement)
+            if not trace_targets(board, lazors, targets):
+                self.assertIn(tuple(sorted(placement)), constrained)
+        solved, tried = solve_constrained(grid, blocks, lazors, targets)
+        self.assertIsNotNone(solved)
+        self.assertLess(tried, solve_brute_force(grid, blocks, lazors, targets)[1])
+
+    # ------------------------------
+    # Test 22: DPLL Solver
+    # ------------------------------
+    def test_solve_dpll(self):
+        """DPLL solves every reference level, placing exactly the given blocks"""
+        for name in sorted(os.listdir(LEVELS_DIR)):
+            with self.subTest(level=name):
+                grid, blocks, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, name))
+                solved, _ = solve_dpll(grid, blocks, lazors, targets)
+                for b in 'ABC':
+                    placed = sum(row.count(b) for row in solved) - sum(row.count(b) for row in grid)
+                    self.assertEqual(placed, blocks[b])
+                self.assertTrue(all_points_hit(trace_all(solved, lazors), targets))
+
+    def test_solve_dpll_learns_clauses(self):
+        """Learnt clauses cut the search well below plain backtracking"""
+        grid, blocks, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'yarn_5.bff'))
+        self.assertLess(solve_dpll(grid, blocks, lazors, targets)[1],
+                        solve_backtracking(grid, blocks, lazors, targets)[1] / 4)
+        grid, blocks, lazors, _ = parse_bff(self.temp_bff.name)
+        self.assertIsNone(solve_dpll(grid, blocks, lazors, [(6, 3), (0, 3), (3, 6)])[0])
+
+    # ------------------------------
+    # Test 23: Slot Ordering
+    # ------------------------------
+    def test_order_slots(self):
+        """Every heuristic orders the same slots, and each search still solves"""
+        grid, blocks, lazors, targets = parse_bff(os.path.join(LEVELS_DIR, 'mad_1.bff'))
+        slots = find_block_positions(grid)
+        self.assertEqual(order_slots(grid, lazors, targets, 'row'), slots)
+        for order in SLOT_ORDERS:
+            with self.subTest(order=order):
+                self.assertEqual(sorted(order_slots(grid, lazors, targets, order)), slots)
+                for solve in (solve_brute_force, solve_backtracking, solve_constrained):
+                    solved, _ = solve(grid, blocks, lazors, targets, order=order)
+                    self.assertTrue(all_points_hit(trace_all(solved, lazors), targets))
+        self.assertEqual(order_slots(grid, lazors, targets, 'target')[0], (1, 3))
+        with self.assertRaises(ValueError):
+            order_slots(grid, lazors, targets, 'random')
+
+    def test_order_option(self):
+        """The CLI passes --order through, and rejects it for solvers without one"""
+        with unittest.mock.patch('sys.stdout', io.StringIO()) as out:
+            self.assertEqual(main(['solve', self.temp_bff.name, '--jobs', '1', '--order', 'beam',
+                                   '--no-store']), 0)
+        self.assertTrue(json.loads(out.getvalue())['solved'])
+        with self.assertRaises(ValueError):
+            solve_level(self.temp_bff.name, 'dpll', 'beam')
+
+    # ------------------------------
+    # Test 24: Streaming Parser
+    # ------------------------------
+    def write_bff(self, content):
+        """Writes content to a temporary .bff file that is removed after the test"""
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.bff') as f:
+            f.write(content)
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_parse_bff_comments(self):
+        """Comments are skipped, so block letters in them are not counted"""
+        path = self.write_bff("# A 10 of these would be too many\nGRID START\nxoo\no o o\nGRID STOP\n"
+                              "\nB 1\n# L 9 9 1 1\nL 3 0 -1 1\nP 0 3\n")
+        grid, blocks, lazors, targets = parse_bff(path)
+        self.assertEqual(grid[1], ['x', 'x', 'x', 'o', 'x', 'o', 'x'])
+        self.assertEqual(blocks, {'A': 0, 'B': 1, 'C': 0})
+        self.assertEqual(lazors, [((3, 0), (-1, 1))])
+        self.assertEqual(targets, [(0, 3)])
+
+    def test_parse_bff_errors(self):
+        """Malformed files are reported with the line at fault"""
+        cases = [
+            ("GRID START\no o\no q\nGRID STOP\n", 3, "unknown grid cell 'q'"),
+            ("GRID START\no o\no o o\nGRID STOP\n", 3, "grid row has 3 cells"),
+            ("\nGRID START\no o\n", 2, "GRID START without GRID STOP"),
+            ("GRID START\no o\nGRID STOP\nL 1 2 1\n", 4, "lazor L takes 4 number(s)"),
+            ("GRID START\no o\nGRID STOP\nP 1 y\n", 4, "target P expects integers"),
+            ("GRID START\no o\nGRID STOP\nA 1\nA 2\n", 5, "block count for A given twice"),
+            ("GRID START\no o\nGRID STOP\nQ 1\n", 4, "unexpected line 'Q 1'"),
+            ("A 1\n", 1, "no GRID START"),
+        ]
+        for content, line, message in cases:
+            with self.subTest(message=message):
+                path = self.write_bff(content)
+                with self.assertRaises(BffError) as caught:
+                    parse_bff(path)
+                self.assertEqual(caught.exception.line, line)
+                self.assertIn(f"{path}:{line}: {message}", str(caught.exception))
+                self.assertIsInstance(caught.exception, ValueError)
+
+    def test_parse_error_in_pool(self):
+        """A malformed level in a pooled run reports its own error and leaves the rest alone"""
+        error = pickle.loads(pickle.dumps(BffError('f.bff', 3, 'x')))
+        self.assertEqual((error.path, error.line, str(error)), ('f.bff', 3, 'f.bff:3: x'))
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ('mad_1', 'tiny_5', 'dark_1'):
+                shutil.copy(os.path.join(LEVELS_DIR, name + '.bff'), tmp)
+            with open(os.path.join(tmp, 'broken.bff'), 'w') as f:
+                f.write("GRID START\no q\nGRID STOP\n")
+            out = io.StringIO()
+            self.assertFalse(solve_directory(tmp, jobs=2, out=out))
+        results = {r['level']: r for r in map(json.loads, out.getvalue().splitlines())}
+        self.assertEqual(sorted(results), ['broken', 'dark_1', 'mad_1', 'tiny_5'])
+        self.assertTrue(results['broken']['error'].startswith('BffError: '))
+        self.assertTrue(all(results[name]['solved'] for name in ('dark_1', 'mad_1', 'tiny_5')))
+
+    # ------------------------------
+    # Test 25: Solution Store
+    # ------------------------------
+    def test_solution_store(self):
+        """Stored solutions are reused, verified, shared by mirror images and evicted LRU"""
+        levels = {name: parse_bff(os.path.join(LEVELS_DIR, name + '.bff'))
+                  for name in ('mad_1', 'tiny_5', 'dark_1')}
+        with tempfile.TemporaryDirectory() as tmp, SolutionStore(os.path.join(tmp, 'db'), max_entries=2) as store:
+            grid, blocks, lazors, targets = levels['mad_1']
+            self.assertIsNone(store.get(grid, blocks, lazors, targets))
+            solved, _ = solve_backtracking(grid, blocks, lazors, targets)
+            store.put(grid, blocks, lazors, targets, solved)
+            self.assertEqual(store.get(grid, blocks, lazors, targets), solved)
+
+            # The level flipped left to right has the same fingerprint and a flipped solution
+            flip = (False, True, False)
+            h, w = len(grid), len(grid[0])
+            mirror = lambda g: [row[::-1] for row in g]
+            mirrored = (mirror(grid), blocks,
+                        [(transform_point(flip, w, h, p), transform_direction(flip, d)) for p, d in lazors],
+                        [transform_point(flip, w, h, t) for t in targets])
+            self.assertEqual(level_fingerprint(*mirrored)[0], level_fingerprint(grid, blocks, lazors, targets)[0])
+            self.assertEqual(store.get(*mirrored), mirror(solved))
+
+            # A wrong solution is caught by the trace and dropped
+            store.put(grid, blocks, lazors, targets, grid)
+            self.assertIsNone(store.get(grid, blocks, lazors, targets))
+            self.assertEqual(len(store), 0)
+
+            for name in ('mad_1', 'tiny_5', 'dark_1'):
+                level = levels[name]
+                store.put(*level, solve_backtracking(*level)[0])
+                if name == 'tiny_5':
+                    store.get(*levels['mad_1'])
+            self.assertEqual(len(store), 2)
+            self.assertIsNone(store.get(*levels['tiny_5']))
+            self.assertIsNotNone(store.get(*levels['mad_1']))
+
+    def test_solve_level_store(self):
+        """A second run of a level is answered from the store without searching"""
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, 'solutions.sqlite3')
+            first = solve_level(self.temp_bff.name, store=store)
+            second = solve_level(self.temp_bff.name, store=store)
+        self.assertTrue(first['solved'] and second['solved'])
+        self.assertEqual((first['stored'], second['stored'], second['candidates']), (False, True, 0))
+
+    def test_unusable_store(self):
+        """A store that cannot be opened costs a warning, not the level"""
+        with tempfile.NamedTemporaryFile() as not_a_dir, \
+                unittest.mock.patch('sys.stderr', io.StringIO()) as err:
+            store = os.path.join(not_a_dir.name, 'solutions.sqlite3')
+            results = [solve_level(self.temp_bff.name, store=store) for _ in range(2)]
+        self.assertTrue(all(r['solved'] and not r['stored'] for r in results))
+        self.assertEqual(err.getvalue().count('warning: solution store'), 1)
+
+    # ------------------------------
+    # Test 26: Solution Object
+    # ------------------------------
+    def test_solve_lazor_solution(self):
+        """solve_lazor returns the placements and beam paths and draws nothing unless asked"""
+        path = os.path.join(LEVELS_DIR, 'mad_1.bff')
+        grid, blocks, lazors, targets = parse_bff(path)
+        with unittest.mock.patch('lazors.draw_solution') as draw:
+            solution = solve_lazor(path)
+            draw.assert_not_called()
+        self.assertIsInstance(solution, Solution)
+        self.assertTrue(solution.solved)
+        self.assertEqual(sorted(b for _, b in solution.placements),
+                         sorted(b for b in 'ABC' for _ in range(blocks[b])))
+        self.assertTrue(all(grid[i][j] == 'o' and solution.grid[i][j] == b for (i, j), b in solution.placements))
+        self.assertEqual(solution.paths, [trace(solution.grid, p, d) for p, d in lazors])
+        self.assertGreater(solution.candidates, 0)
+        self.assertEqual(solution.summary()['level'], 'mad_1')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            image = solution.render(os.path.join(tmp, 'mad_1.png'))
+            self.assertTrue(os.path.getsize(image) > 0)
+
+    def test_solve_lazor_unsolvable(self):
+        """An unsolvable level gives an empty Solution that refuses to render"""
+        path = self.write_bff("GRID START\no o\nGRID STOP\nA 1\nL 0 1 1 1\nP 4 1\n")
+        solution = solve_lazor(path)
+        self.assertFalse(solution.solved)
+        self.assertEqual((solution.placements, solution.paths), ([], []))
+        with self.assertRaises(ValueError):
+            solution.render()
+
+    # ------------------------------
+    # Test 27: Lazy Imports
+    # ------------------------------
+    def test_import_is_lazy(self):
+        """Importing lazors and solving a level loads neither PIL nor the pool, cache or CLI modules"""
+        heavy = ['PIL', 'copy', 'concurrent.futures', 'multiprocessing', 'sqlite3', 'pickle', 'tempfile', 'argparse']
+        script = (f"import sys, lazors; lazors.solve_lazor({self.temp_bff.name!r}); "
+                  f"print(' '.join(m for m in {heavy!r} if m in sys.modules))")
+        loaded = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+        self.assertEqual(loaded, [])
+
 if __name__ == '__main__':
     unittest.main()